@@ -13,23 +13,48 @@ Accepts the upload of a GEDCOM file, parses it, and displays a "star map" like n
 import streamlit as st
 import os
 import re
+import sys
+import hmac
+import time
 import base64
+import threading
+import json
+import gzip
+import bz2
+import zlib
+import codecs
+import tempfile
+import zipfile
+import io
+import multiprocessing
+import unicodedata
+import bisect
+import heapq
+import difflib
 import numpy as np
 import plotly.graph_objects as go
 import networkx as nx
 import matplotlib.colors as mcolors
+from matplotlib import font_manager
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
 import hashlib
-from PIL import Image
+import pickle
+from PIL import Image, ImageDraw, ImageFont
 from gedcom.parser import Parser
 from gedcom.parser import GedcomFormatViolationError
 from gedcom.element.individual import IndividualElement
 from gedcom.element.family import FamilyElement
-from iteration_utilities import duplicates, unique_everseen
 from itertools import combinations, product
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pyvis.network import Network
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial import cKDTree
 from st_pages import Page, show_pages, add_page_title
 from streamlit_js_eval import streamlit_js_eval
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from time import sleep
 from random import seed
 from st_social_media_links import SocialMediaIcons
@@ -40,6 +65,96 @@ IMAGE_PATH = os.path.join(BASE_DIR, 'logo.png')
 favicon = os.path.join(BASE_DIR, 'favicon.png')
 favicon = Image.open(favicon)
 
+## Memory budget for heavy per-file objects (parsed trees, layouts) shared by all sessions.
+MEMORY_BUDGET = int(os.environ.get("MEMORY_BUDGET_MB", "512")) * 1024 ** 2
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "1800")) # seconds before an idle session releases its artifacts
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") # memory usage report is shown at ?admin=<ADMIN_TOKEN>
+
+## Offline gazetteer for the Map view, and the on-disk cache of places it resolved
+GAZETTEER_DIR = os.path.join(BASE_DIR, 'gazetteer')
+GEOCODE_CACHE = os.environ.get("GEOCODE_CACHE", os.path.join(BASE_DIR, '.cache', 'geocode.json'))
+GEOCODE_HINT_KM = 50 # a place named before a city (e.g. "Kensington, London") has to be this close to it
+GEOCODE_VERSION = 3 # cached places are resolved again when this changes
+
+## Typeahead search for individuals
+SEARCH_RESULTS = 50 # options shown by the individual selectors
+
+## Disconnected trees are laid out separately (in parallel) and packed next to each other
+PARALLEL_COMPONENT_SIZE = 200 # components at least this large are laid out in worker processes
+LAYOUT_WORKERS = int(os.environ.get("LAYOUT_WORKERS", os.cpu_count() or 1))
+
+## Uploads: plain or compressed GEDCOM files (gzip, bzip2, zip and GEDZIP archives), decompressed while reading
+UPLOAD_TYPES = ["ged", "gz", "bz2", "zip", "gdz"] # .ged, .ged.gz, .ged.bz2, .zip and .gdz (GEDZIP, GEDCOM 7)
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE_MB", "1024")) * 1024 ** 2 # decompressed files larger than this are refused
+READ_CHUNK = 1024 ** 2 # bytes decompressed and decoded at a time
+LINE_BREAKS = re.compile(r"(?<=\n)|(?<=\r)(?!\n)") # after \r\n, \r or \n only (str.splitlines also splits on \x0c, \x1c-\x1e, \x85, \u2028...)
+
+## Structural validation of GEDCOM files (GEDCOM 5.5.1 or 7.0 tags, as the header says)
+GEDCOM_LINE = re.compile(r"^(0|[1-9][0-9]*) (@[^@]+@ |)([A-Za-z0-9_]+)( [^\n\r]*|)[\r\n]*$") # same format as the parser
+GEDCOM_TAGS = set("""ABBR ADDR ADR1 ADR2 ADR3 ADOP AFN AGE AGNC ALIA ANCE ANCI ANUL ASSO AUTH BAPL BAPM BARM BASM BIRT BLES BURI CALN CAST 
+    CAUS CENS CHAN CHAR CHIL CHR CHRA CITY CONC CONF CONL CONT COPR CORP CREM CTRY DATA DATE DEAT DESC DESI DEST DIV DIVF DSCR EDUC EMAIL 
+    EMIG ENDL ENGA EVEN FACT FAM FAMC FAMF FAMS FAX FCOM FILE FONE FORM GEDC GIVN GRAD HEAD HUSB IDNO IMMI INDI LANG LATI LEGA LONG MAP MARB 
+    MARC MARL MARR MARS MEDI NAME NATI NATU NCHI NICK NMR NOTE NPFX NSFX OBJE OCCU ORDI ORDN PAGE PEDI PHON PLAC POST PROB PROP PUBL QUAY 
+    REFN RELA RELI REPO RESI RESN RETI RFN RIN ROLE ROMN SEX SLGC SLGS SOUR SPFX SSN STAE STAT SUBM SUBN SURN TEMP TEXT TIME TITL TRLR TYPE 
+    VERS WIFE WWW""".split())
+GEDCOM7_TAGS = set("""ABBR ADDR ADOP ADR1 ADR2 ADR3 AGE AGNC ALIA ANCI ANUL ASSO AUTH BAPL BAPM BARM BASM BIRT BLES BURI CALN CAST CAUS CENS 
+    CHAN CHIL CHR CHRA CITY CONF CONL CONT COPR CORP CREA CREM CROP CTRY DATA DATE DEAT DESI DEST DIV DIVF DSCR EDUC EMAIL EMIG ENDL ENGA 
+    EVEN EXID FACT FAM FAMC FAMS FAX FCOM FILE FORM GEDC GIVN GRAD HEAD HEIGHT HUSB IDNO IMMI INDI INIL LANG LATI LEFT LONG MAP MARB MARC 
+    MARL MARR MARS MEDI MIME NAME NATI NATU NCHI NICK NMR NO NOTE NPFX NSFX OBJE OCCU ORDN PAGE PEDI PHON PHRASE PLAC POST PROB PROP PUBL 
+    QUAY REFN RELI REPO RESI RESN RETI ROLE SCHMA SDATE SEX SLGC SLGS SNOTE SOUR SPFX SSN STAE STAT SUBM SURN TAG TEMP TEXT TIME TITL TOP 
+    TRAN TRLR TYPE UID VERS WIDTH WIFE WWW""".split())
+POINTER_TAGS = {"FAMS": "FAM", "FAMC": "FAM", "HUSB": "INDI", "WIFE": "INDI", "CHIL": "INDI"} # pointer tags and the record they point to
+VALIDATION_LIMIT = 50 # errors after which validation stops (and warnings listed)
+
+## Timeline layout: birth years estimated from GEDCOM date phrases, and from relatives when missing
+GENERATION_YEARS = 25 # years between a parent's and a child's birth, when one of them is unknown
+DATE_MARGIN = 5 # years added to AFT and taken from BEF dates
+TIMELINE_YEAR_WIDTH = 10 # 2D pixels per year
+TIMELINE_ROW_HEIGHT = 40 # 2D pixels between rows (family order)
+
+## Several files uploaded together are merged, with probable duplicate individuals proposed for review
+DUPLICATE_YEARS = 5 # birth years are compared in buckets of this many years, and must be at most this far apart
+DUPLICATE_SCORE = 0.85 # minimum name similarity (0 to 1) for two individuals of different files to be proposed as the same person
+
+## Relationship color scale: individuals colored by their distance from the root (kinship degree or connections)
+RELATIONSHIP_ROOTS = 8 # roots per file whose distances are kept
+
+## Family overview: families drawn as hub nodes, branches collapsed into super-nodes that open on click
+FAMILY_HUB_SIZE = 4 # size of family hub nodes (individuals are 10)
+FAMILY_CLUSTER_MIN = 10 # branches with fewer individuals are not collapsed
+
+## Artifacts of the bundled files computed at build time (python app.py --precompute), served by content hash
+PRECOMPUTED_DIR = os.environ.get("PRECOMPUTED_DIR", os.path.join(BASE_DIR, 'precomputed'))
+with open(os.path.abspath(__file__), 'rb') as file:
+    PRECOMPUTED_VERSION = hashlib.sha256(file.read()).hexdigest() # artifacts computed by another version of the app are ignored
+
+## Static image export (PNG, SVG, PDF), drawn on the server from the computed positions
+EXPORT_DPI = 100 # pixels per inch, sizes are given in pixels
+EXPORT_TILE_PIXELS = 4096 # larger PNG images are split into tiles of at most this size (bounded memory)
+EXPORT_MAX_PIXELS = 16384 # largest width and height
+
+## Size of what is sent to the browser per render
+PAYLOAD_BUDGET = int(os.environ.get("PAYLOAD_BUDGET_KB", "1024")) * 1024 # bytes per render, over budget renders are flagged in the admin report
+PAYLOAD_STEPS = 2000 # 3D coordinates are sent as integers, the widest axis of the drawing split in this many steps
+
+## Layouts started from previously computed positions need far less work than from scratch
+WARM_START_STABILIZATION = 250 # vis.js stabilization iterations for a seeded 2D layout (1000 from scratch)
+WARM_START_ITERATIONS = 15 # Fruchterman-Reingold iterations for a changed component of a re-uploaded file (50 from scratch)
+
+## 2D rendering profile by network size (vis.js): networks with more individuals than these (or more than twice as many connections) are drawn
+## at once and settle on screen instead of after a blocking stabilization, with a capped number of physics iterations, no improvedLayout (quadratic),
+## straight edges, and labels drawn only when zoomed in (and shown on hover)
+LARGE_NETWORK = int(os.environ.get("LARGE_NETWORK", "500"))
+HUGE_NETWORK = int(os.environ.get("HUGE_NETWORK", "2000"))
+LARGE_NETWORK_ITERATIONS = 300 # physics iterations (one per frame) once every individual is drawn, after which the physics is turned off
+HUGE_NETWORK_ITERATIONS = 100
+LABEL_DRAW_THRESHOLD = 12 # large networks: labels (font size 14) are drawn from this on-screen font size, i.e. when zoomed in
+
+## Progressive rendering: the root's neighborhood is drawn first, the other individuals are added in batches by distance from the root
+PROGRESSIVE_FIRST = 300 # individuals in the first drawing
+PROGRESSIVE_BATCH = 500 # 2D: individuals added per animation frame after the first drawing
+PROGRESSIVE_GROWTH = 4 # 3D: each figure sent has this many times more individuals than the previous one
+
 def get_base64_of_image(image_path):
     with open(image_path, 'rb') as img_file:
         return base64.b64encode(img_file.read()).decode()
@@ -61,32 +176,121 @@ def add_logo():
         unsafe_allow_html=True,
     )
 
-def parse_gedcom(uploaded_file):
+def open_gedcom(uploaded_file):
     """
-    Creates a temporary file and parses it. 
+    Opens the uploaded file for reading, decompressing it on the fly if it is a gzip, bzip2 or zip archive (recognized by its first bytes, whatever its name).
+    Zip archives must hold a single .ged file, or gedcom.ged at the root as in GEDZIP (GEDCOM 7) packages, whose media files are left aside.
 
     input:
-    :uploaded_file: GEDCOM file to be parsed.
+    :uploaded_file: uploaded file (plain or compressed).
 
-    return: 
-    :gedcom_parser: Parsed file.
+    return:
+    :file: binary file object of the GEDCOM content (closing it leaves :uploaded_file: open).
+    """
+    uploaded_file.seek(0)
+    signature = uploaded_file.read(4)
+    uploaded_file.seek(0)
+
+    if signature.startswith(b"\x1f\x8b"):
+        return gzip.GzipFile(fileobj=uploaded_file, mode='rb')
+    if signature.startswith(b"BZh"):
+        return bz2.BZ2File(uploaded_file, mode='rb')
+    if signature.startswith(b"PK\x03\x04"):
+        archive = zipfile.ZipFile(uploaded_file)
+        names = [info.filename for info in archive.infolist() if not info.is_dir() and info.filename.lower().endswith(".ged")]
+        if "gedcom.ged" in names:
+            names = ["gedcom.ged"]
+        if len(names) != 1:
+            raise ValueError("The uploaded archive does not contain a GEDCOM file." if not names else 
+                             f"The uploaded archive contains {len(names)} GEDCOM files, upload them as separate files to merge them.")
+        return archive.open(names[0])
+    return uploaded_file
+
+def read_gedcom(uploaded_file):
     """
+    Reads and decodes the uploaded file into lines, decompressing it chunk by chunk when compressed (see open_gedcom): 
+    only the lines and the current chunk are held in memory, never the whole decompressed bytes or text.
 
-    # Save the uploaded file temporarily with UTF-8 encoding
-    temp_file_path = "temp_gedcom_file.ged"
-    with open(temp_file_path, "w", encoding='utf-8') as temp_file:
-        temp_file.write(uploaded_file.read().decode('utf-8', 'ignore'))
+    input:
+    :uploaded_file: GEDCOM file to be parsed (plain or compressed).
+
+    return: 
+    :lines: list of lines of the file (with their line endings, the last one ending with a newline).
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+    lines, partial, size = [], "", 0
+    try:
+        file = open_gedcom(uploaded_file)
+        try:
+            while True:
+                chunk = file.read(READ_CHUNK)
+                size += len(chunk)
+                if size > UPLOAD_MAX_SIZE:
+                    raise ValueError(f"The uploaded file is larger than {UPLOAD_MAX_SIZE // 1024 ** 2} MB once decompressed.")
+                chunk_lines = LINE_BREAKS.split(partial + decoder.decode(chunk, final=not chunk))
+                # The last line may go on in the next chunk (a \r may also be the first half of a \r\n)
+                partial = chunk_lines.pop()
+                if chunk and not partial and chunk_lines and chunk_lines[-1].endswith("\r"):
+                    partial = chunk_lines.pop()
+                lines.extend(chunk_lines)
+                if not chunk:
+                    if partial:
+                        lines.append(partial)
+                    break
+        finally:
+            if file is not uploaded_file:
+                file.close()
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile):
+        raise ValueError("The uploaded file could not be decompressed, the archive may be damaged or incomplete.")
 
     # Additional check for GEDCOM file integrity.
-    with open("temp_gedcom_file.ged", "r", encoding='utf-8') as temp_file:
-        first_line = temp_file.readline()
-        if not first_line.lstrip('\ufeff').startswith("0 HEAD"):
-            raise ValueError("The uploaded file does not appear to be a valid GEDCOM file.")
+    if not lines or not lines[0].lstrip('\ufeff').startswith("0 HEAD"):
+        raise ValueError("The uploaded file does not appear to be a valid GEDCOM file.")
+
+    # Check if the file does not end with a newline and add one
+    if not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+
+    return lines
 
-    # Check if the file path does not end with a newline and add one
-    if not temp_file_path.endswith('\n'):
-        with open(temp_file_path, "a", encoding='utf-8') as temp_file:
-            temp_file.write('\n')
+def split_records(lines):
+    """
+    Splits the GEDCOM lines into level 0 records and fingerprints each record.
+
+    input:
+    :lines: list of lines of the GEDCOM file.
+
+    return:
+    :records: dictionary of pointer (e.g. @I1@) to (tag, content hash, first line, last line + 1) of INDI and FAM records.
+    """
+    records = {}
+    current = None
+    for i, line in enumerate(lines + ["0 TRLR\n"]):
+        if line.startswith("0"):
+            if current is not None:
+                pointer, tag, start = current
+                records[pointer] = (tag, hashlib.blake2b("".join(lines[start:i]).encode(), digest_size=16).digest(), start, i)
+            parts = line.split()
+            current = None
+            if len(parts) > 2 and parts[1].startswith("@") and parts[2] in ("INDI", "FAM"):
+                current = (parts[1], parts[2], i)
+    return records
+
+def parse_gedcom(lines):
+    """
+    Creates a temporary file and parses it. 
+
+    input:
+    :lines: list of GEDCOM lines to be parsed.
+
+    return: 
+    :gedcom_parser: Parsed file.
+    """
+
+    # Save the lines temporarily with UTF-8 encoding (a file of its own, sessions may be parsing at the same time)
+    with tempfile.NamedTemporaryFile('w', suffix=".ged", delete=False, encoding='utf-8') as temp_file:
+        temp_file.writelines(lines)
+    temp_file_path = temp_file.name
 
     # Initialize parser
     gedcom_parser = Parser()
@@ -97,12 +301,98 @@ def parse_gedcom(uploaded_file):
     
     return gedcom_parser
 
-def check_duplicates(lst):
-    dups = list(unique_everseen(duplicates(lst)))
-    if dups == []:
-        pass
-    else:
-        raise ValueError(" ".join(dups) + " duplicated. GEDCOM files should not have duplicate IDs. Please check your file.")
+def format_lines(numbers, limit=10):
+    """
+    Formats a list of line numbers for messages, e.g. "lines 3, 8 and 12" (only the first :limit: are listed).
+    """
+    listed = ", ".join(str(number) for number in numbers[:limit])
+    if len(numbers) > limit:
+        return f"lines {listed} and {len(numbers) - limit} more"
+    return f"line {listed}" if len(numbers) == 1 else f"lines {listed}"
+
+def gedcom_version(lines):
+    """
+    Version of the GEDCOM standard given in the header of the file (HEAD.GEDC.VERS, e.g. "5.5.1" or "7.0"), None if not given.
+    """
+    gedc = False
+    for line in lines[1:]:
+        parts = line.split(None, 2)
+        if not parts or parts[0] == "0": # end of the header
+            break
+        if parts[0] == "1":
+            gedc = parts[1:2] == ["GEDC"]
+        elif gedc and parts[0] == "2" and parts[1:2] == ["VERS"] and len(parts) == 3:
+            return parts[2].strip()
+    return None
+
+def validate_gedcom(lines):
+    """
+    Checks the structure of the file in a single pass, before anything is parsed: duplicate IDs and level jumps 
+    (that would stop the parser) are errors; malformed lines, unknown tags and pointers to records 
+    that are not in the file are warnings (they are skipped). Stops after VALIDATION_LIMIT errors.
+    Tags are those of GEDCOM 7.0 if the header says so (where @VOID@ is a pointer to nothing), of GEDCOM 5.5.1 otherwise.
+
+    input:
+    :lines: list of lines of the GEDCOM file.
+
+    return:
+    :errors: list of messages (with line numbers) of the problems that prevent processing the file.
+    :warnings: list of messages (with line numbers) of the problems that are skipped.
+    """
+    errors = []
+    definitions = {} # pointer to (tag, line number)
+    references = [] # (line number, tag, pointer)
+    unknown_tags = {}
+    malformed = []
+    tags = GEDCOM7_TAGS if (gedcom_version(lines) or "").startswith("7") else GEDCOM_TAGS
+
+    previous_level = -1
+    for number, line in enumerate(lines, start=1):
+        if number == 1:
+            line = line.lstrip('\ufeff')
+        if not line.strip(" \t\r\n\x1a"): # blank lines and end of file markers
+            continue
+        match = GEDCOM_LINE.match(line)
+        if match is None:
+            malformed.append(number) # the parser reads these as a continuation of the previous line
+            continue
+        level, pointer, tag, value = int(match.group(1)), match.group(2).strip(), match.group(3), match.group(4).strip()
+
+        if level > previous_level + 1:
+            errors.append(f"Line {number}: level {level} follows level {previous_level}, levels can only increase one at a time.")
+        previous_level = level
+
+        if pointer and level == 0:
+            if pointer in definitions:
+                errors.append(f"Line {number}: {pointer} is already defined on line {definitions[pointer][1]}. GEDCOM files should not have duplicate IDs.")
+            else:
+                definitions[pointer] = (tag, number)
+
+        if tag in POINTER_TAGS and value.startswith("@"):
+            if value != "@VOID@":
+                references.append((number, tag, value))
+        elif tag not in tags and not tag.startswith("_"): # tags starting with _ are user defined
+            unknown_tags.setdefault(tag, []).append(number)
+
+        if len(errors) >= VALIDATION_LIMIT:
+            errors.append(f"Stopped at line {number} of {len(lines)} after {VALIDATION_LIMIT} errors.")
+            return errors, []
+
+    warnings = []
+    dangling = {}
+    for number, tag, pointer in references:
+        if pointer not in definitions:
+            dangling.setdefault((tag, pointer), []).append(number)
+        elif definitions[pointer][0] != POINTER_TAGS[tag]:
+            warnings.append(f"Line {number}: {tag} points to {pointer}, which is a {definitions[pointer][0]} record (line {definitions[pointer][1]}), expected {POINTER_TAGS[tag]}.")
+    warnings += [f"{format_lines(numbers).capitalize()}: {tag} points to {pointer}, which is not in the file." for (tag, pointer), numbers in dangling.items()]
+    warnings += [f"{format_lines(numbers).capitalize()}: unknown tag {tag}." for tag, numbers in unknown_tags.items()]
+    if malformed:
+        warnings.append(f"{format_lines(malformed).capitalize()}: not a GEDCOM line (level, optional ID, tag and value), read as a continuation of the previous line.")
+    if len(warnings) > VALIDATION_LIMIT:
+        warnings = warnings[:VALIDATION_LIMIT] + [f"And {len(warnings) - VALIDATION_LIMIT} more."]
+
+    return errors, warnings
 
 def process_edges(lst):
     """
@@ -136,72 +426,140 @@ def process_edges(lst):
     return result
  
 
-def process_gedcom(gedcom_parser):
+def extract_people(gedcom_parser, records):
     """
-    Creates a ID to name translator (dictionary). Processes the parsed GEDCOM into nodes their label and edges.
+    Extracts what the network needs from each parsed individual.
 
     input:
-    :gedcom_parser: Parsed GEDCOM file.
+    :gedcom_parser: Parsed GEDCOM file (may contain only some of the records).
+    :records: dictionary of all records of the file (see split_records), used to ignore pointers to missing families.
 
     return:
-    :translator: dictionary of short ID to long ID.
-    :nodes: list of long IDs of any individual with connections.
-    :labels: dictionary, with :nodes: as keys, and values as strings with name, place of birth and date of birth of the individuals.
-    :edges: list of connections (pairs and parent-child)
+    :people: dictionary of pointer to name, ID, birth place, birth date, lists of FAMS and FAMC family pointers, 
+        and every family pointer of the record, including pointers to missing families (see process_gedcom).
     """
+    people = {}
+    for element in gedcom_parser.get_root_child_elements():
+        if isinstance(element, IndividualElement): #in elements that are individuals
+            families = {'FAMS': [], 'FAMC': []}
+            references = []
+            for child in element.get_child_elements():
+                if child.get_tag() in families:
+                    references.append(child.get_value())
+                    if records.get(child.get_value(), ("",))[0] == "FAM":
+                        families[child.get_tag()].append(child.get_value())
+
+            people[element.get_pointer()] = {
+                'name': " ".join(element.get_name()),
+                'surname': element.get_name()[1],
+                'id': str(element.get_pointer()).replace("@", ""),
+                'birth_place': element.get_birth_data()[1],
+                'birth_date': element.get_birth_data()[0],
+                'fams': families['FAMS'],
+                'famc': families['FAMC'],
+                'family_references': references,
+            }
+    return people
 
-    root_child_elements = gedcom_parser.get_root_child_elements()
-    
-    # Process data
-    translator = {} #from pointer to node name
-    labels = {} #collect for node labels
-    
-    fams = {} #collect spouses per family for pair edges
-    famc = {} #collect per family for children edges
+def process_gedcom(lines, previous=None, name=None):
+    """
+    Creates a ID to name translator (dictionary). Processes the GEDCOM into nodes their label and edges.
+    If the :previous: version of the same tree is given, only the records that changed are parsed again, 
+    and only the families they touch are rebuilt.
 
-    elements = []
-    
-    for element in root_child_elements: #elements that are individuals or family
-        if isinstance(element, IndividualElement): #in elements that are individuals
-            elements.append(element.get_pointer())
-            name = " ".join(element.get_name())
-            id = str(element.get_pointer()).replace("@", "")
-            bp = element.get_birth_data()[1] #birth place
-            bd = element.get_birth_data()[0] #birth date
-    
-            #collect node info into translator
-            translator[element.get_pointer()] = str(name + " (" + id + ")")
-            labels[translator[element.get_pointer()]] = str(name + " \n " + bp + " \n " + bd)
-    
-            for family in gedcom_parser.get_families(element, family_type='FAMS'):
-                key = str(family.get_pointer())
-                value = str(translator[element.get_pointer()])
-                fams.setdefault(key, []).append(value)
-            
-            for family in gedcom_parser.get_families(element, family_type='FAMC'):
-                key = str(family.get_pointer())
-                value = str(translator[element.get_pointer()])
-                famc.setdefault(key, []).append(value)
+    input:
+    :lines: list of lines of the GEDCOM file (see read_gedcom).
+    :previous: tree returned by process_gedcom for a previous upload (optional).
+    :name: file name, given in the error message when several files are processed (optional).
 
-    try:
-        check_duplicates(elements)
+    return:
+    :tree: dictionary with
+        :translator: dictionary of short ID to long ID.
+        :nodes: list of long IDs of any individual with connections.
+        :labels: dictionary, with :nodes: as keys, and values as strings with name, place of birth and date of birth of the individuals.
+        :edges: list of connections (pairs and parent-child)
+        :parents: dictionary of long ID to the long IDs of their parents (ancestor index).
+        :warnings: list of the problems found in the file that were skipped (see validate_gedcom).
+        :changed: set of long IDs that are new or changed compared to :previous: (all nodes without :previous:).
+        plus the record fingerprints and family memberships needed to update it incrementally.
+    """
 
-    except ValueError as e:
-        st.error(f'**Error:** {str(e)}')
+    # Structural problems are all found in one pass, before anything is parsed
+    errors, warnings = validate_gedcom(lines)
+    if errors:
+        st.error(f"**Error:** The file {name + ' ' if name else ''}cannot be processed. Please check your file. \n\n" + "\n".join(f"- {error}" for error in errors))
         st.stop()
 
-    # Create edges
-    try:
-        pairs = [] #edges for couples
-        pairs.extend(tuple(val) for val in fams.values() if len(val) > 1)
-        pairs = [tuple(val) for val in fams.values() if len(val) > 1]
-        
-        children = [] #edges for parent-child
-        children.extend(list(product(fams[key], famc[key])) for key in fams.keys() if key in famc)
-        children = sum(children, [])
-        
-        edges = pairs + children #merge lists
+    records = split_records(lines)
+
+    if previous is None:
+        previous = {'records': {}, 'people': {}, 'translator': {}, 'reverse_translator': {}, 'labels': {}, 'fams': {}, 'famc': {}, 'family_edges': {}, 'parents': {}}
+
+    # Diff at the record level: individuals that are new, changed, or removed
+    changed = [pointer for pointer, record in records.items() if record[0] == "INDI" and previous['records'].get(pointer, ())[:2] != record[:2]] # tag and content hash
+    removed = [pointer for pointer in previous['people'] if records.get(pointer, ("",))[0] != "INDI"]
+    # families that appeared or disappeared change which FAMS/FAMC pointers are valid, so the individuals pointing to them 
+    # (also through pointers that were ignored because the family was missing) are extracted again
+    families_changed = {pointer for pointer, record in records.items() if record[0] == "FAM" and previous['records'].get(pointer, ("",))[0] != "FAM"}
+    families_changed |= {pointer for pointer, record in previous['records'].items() if record[0] == "FAM" and records.get(pointer, ("",))[0] != "FAM"}
+    changed += [pointer for pointer, person in previous['people'].items() if records.get(pointer, ("",))[0] == "INDI" and pointer not in changed and families_changed.intersection(person['family_references'])]
+
+    # Parse only the changed individuals
+    people = dict(previous['people'])
+    for pointer in removed:
+        del people[pointer]
+    if changed:
+        subset = []
+        for pointer in changed:
+            _, _, start, end = records[pointer]
+            subset.extend(lines[start:end])
+        people.update(extract_people(parse_gedcom(subset), records))
 
+    # Process data
+    translator = dict(previous['translator']) #from pointer to node name
+    labels = dict(previous['labels']) #collect for node labels
+    fams = {key: list(value) for key, value in previous['fams'].items()} #collect spouses per family for pair edges
+    famc = {key: list(value) for key, value in previous['famc'].items()} #collect per family for children edges
+
+    touched = set() # families whose edges have to be rebuilt
+    for pointer in removed + changed:
+        if pointer in translator:
+            old = translator.pop(pointer)
+            labels.pop(old, None)
+            for key in previous['people'][pointer]['fams']:
+                fams[key].remove(old)
+                touched.add(key)
+            for key in previous['people'][pointer]['famc']:
+                famc[key].remove(old)
+                touched.add(key)
+
+    for pointer in changed:
+        person = people[pointer]
+        #collect node info into translator
+        translator[pointer] = str(person['name'] + " (" + person['id'] + ")")
+        label = str(person['name'] + " \n " + person['birth_place'] + " \n " + person['birth_date'])
+        while ", , " in label:
+            label = re.sub(r',\s*,', ',', label)
+        labels[translator[pointer]] = label
+
+        for key in person['fams']:
+            fams.setdefault(key, []).append(translator[pointer])
+            touched.add(key)
+        for key in person['famc']:
+            famc.setdefault(key, []).append(translator[pointer])
+            touched.add(key)
+
+    # Create edges, only for the families that were touched
+    family_edges = dict(previous['family_edges'])
+    for key in touched:
+        pairs = [tuple(fams.get(key, []))] if len(fams.get(key, [])) > 1 else [] #edges for couples
+        children = list(product(fams.get(key, []), famc.get(key, []))) #edges for parent-child
+        family_edges[key] = process_edges(pairs + children)
+        if not family_edges[key]:
+            del family_edges[key]
+
+    edges = [edge for key in family_edges for edge in family_edges[key]]
+    try:
         if len(edges) < 1:
             raise ValueError("There seem to be no connections between individuals. Cannot proceed. Please check your file.")
 
@@ -209,45 +567,348 @@ def process_gedcom(gedcom_parser):
         st.error(f'**Error:** {str(e)}')
         st.stop()
 
-    edges = process_edges(edges)
+    # Update the ancestor index for the changed individuals and the children of touched families
+    parents = dict(previous['parents'])
+    for pointer in removed + changed:
+        parents.pop(previous['translator'].get(pointer), None)
+    reverse_translator = {translator[pointer]: pointer for pointer in changed}
+    affected = set(changed) | {reverse_translator.get(child) or previous['reverse_translator'][child] for key in touched for child in famc.get(key, [])}
+    for pointer in affected:
+        parents[translator[pointer]] = [parent for key in people[pointer]['famc'] for parent in fams.get(key, [])]
 
     # Create and filter nodes
-    nodes = list(translator.values())
-    nodes = [node for node in nodes if any(node in edge for edge in edges)] #delete nodes with no edges
+    connected = {node for edge in edges for node in edge}
+    nodes = [node for node in translator.values() if node in connected] #delete nodes with no edges
+
+    return {
+        'records': records,
+        'people': people,
+        'translator': translator,
+        'reverse_translator': {**{k: v for k, v in previous['reverse_translator'].items() if translator.get(v) == k}, **reverse_translator},
+        'labels': labels,
+        'fams': fams,
+        'famc': famc,
+        'family_edges': family_edges,
+        'parents': parents,
+        'nodes': nodes,
+        'edges': edges,
+        'warnings': warnings,
+        'changed': {translator[pointer] for pointer in changed},
+    }
 
-    # Filter label dictionary for nodes with edges
-    keys_to_delete = [key for key in labels if key not in nodes]
-    for key in keys_to_delete:
-        del labels[key]
+def combine_trees(trees, file_names):
+    """
+    Combines processed files into a single tree, without merging anyone. Pointers and IDs of the second and following files
+    are prefixed with the file number, so that they do not collide (e.g. @I1@ and "Name (I1)" of the second file become @2:I1@ and "Name (2:I1)").
 
-    # Clean up labels
-    for key, value in labels.items():
-        while ", , " in value:
-            value = re.sub(r',\s*,', ',', value)
-        labels[key] = value
+    input:
+    :trees: list of trees returned by process_gedcom.
+    :file_names: list of the names of the files (for the warnings).
 
-    return translator, nodes, labels, edges
+    return:
+    :tree: dictionary with the same keys as process_gedcom (record fingerprints left out), plus
+        :sources: dictionary of long ID to the number of the file it comes from (1 for the first file).
+    """
+    combined = {'people': {}, 'translator': {}, 'reverse_translator': {}, 'labels': {}, 'fams': {}, 'famc': {}, 'family_edges': {}, 'parents': {}, 'nodes': [], 'edges': [], 'warnings': [], 'sources': {}}
+    for number, (tree, file_name) in enumerate(zip(trees, file_names), start=1):
+        prefix = f"{number}:" if number > 1 else ""
+        pointer = lambda key: "@" + prefix + key[1:] if prefix else key
+        rename = {node: node[:node.rfind("(") + 1] + prefix + node[node.rfind("(") + 1:] for node in tree['translator'].values()}
+        node = lambda key: rename.get(key, key)
+
+        for key, person in tree['people'].items():
+            combined['people'][pointer(key)] = {**person, 'id': prefix + person['id'], 'fams': [pointer(family) for family in person['fams']], 'famc': [pointer(family) for family in person['famc']],
+                                                 'family_references': [pointer(family) for family in person['family_references']]}
+        for key, value in tree['translator'].items():
+            combined['translator'][pointer(key)] = node(value)
+            combined['reverse_translator'][node(value)] = pointer(key)
+            combined['sources'][node(value)] = number
+        combined['labels'].update({node(key): label for key, label in tree['labels'].items()})
+        for name in ['fams', 'famc']:
+            combined[name].update({pointer(key): [node(member) for member in members] for key, members in tree[name].items()})
+        combined['family_edges'].update({pointer(key): [tuple(node(member) for member in edge) for edge in edges] for key, edges in tree['family_edges'].items()})
+        combined['parents'].update({node(key): [node(parent) for parent in parents] for key, parents in tree['parents'].items()})
+        combined['nodes'] += [node(key) for key in tree['nodes']]
+        combined['edges'] += [tuple(node(member) for member in edge) for edge in tree['edges']]
+        combined['warnings'] += [f"{file_name}: {warning}" for warning in tree['warnings']]
+
+    combined['changed'] = set(combined['nodes'])
+    return combined
+
+def find_duplicates(tree):
+    """
+    Finds individuals of different files that are probably the same person. Individuals are indexed by blocking keys
+    (normalized surname, birth year bucket of DUPLICATE_YEARS and a word of the place of birth, one key per word), and only individuals
+    sharing a key (or with the neighbouring year bucket) are compared, so the comparisons grow with the number of individuals, not with its square.
+    Each individual is proposed at most once, best matches first.
 
-def get_ancestors(gedcom_parser, translator, individual):
+    input:
+    :tree: combined tree (see combine_trees).
+
+    return:
+    :duplicates: list of (long ID kept, long ID of the duplicate, name similarity), the kept individual comes from the earlier file.
     """
-    Creates a name to ID translator (dictionary). Gets a list of ancestors of a specified individual.
+    nodes = tree['nodes']
+    people = [tree['people'][tree['reverse_translator'][node]] for node in nodes]
+    years = parse_years([person['birth_date'] for person in people], get_date_cache())
+
+    keys = {}
+    blocks = {}
+    for node, person, year in zip(nodes, people, years):
+        name = normalize_place(person['name'])
+        surname = normalize_place(person['surname']) or (name.split() or [""])[0] # individuals without a surname are grouped by their first name
+        places = {word for word in normalize_place(person['birth_place']).split() if word not in PLACE_STOPWORDS} or {""} # e.g. "Pope's Creek, Westmoreland Co., Virginia" and "Wakefield, Westmoreland, Virginia" share two words
+        bucket = None if np.isnan(year) else int(year // DUPLICATE_YEARS)
+        keys[node] = (surname, bucket, places, name, year)
+        for place in places:
+            blocks.setdefault((surname, bucket, place), []).append(node)
+
+    candidates = []
+    for node in nodes:
+        surname, bucket, places, name, year = keys[node]
+        compared = set()
+        for place in places:
+            for offset in ([-1, 0, 1] if bucket is not None else [None]):
+                for other in blocks.get((surname, bucket + offset if offset is not None else None, place), []):
+                    if other in compared or tree['sources'][other] >= tree['sources'][node]:
+                        continue # each pair once, across files only
+                    compared.add(other)
+                    if not np.isnan(year) and abs(year - keys[other][4]) > DUPLICATE_YEARS:
+                        continue
+                    score = difflib.SequenceMatcher(None, name, keys[other][3]).ratio()
+                    if score >= DUPLICATE_SCORE:
+                        candidates.append((score, other, node))
+
+    duplicates = []
+    used = set()
+    for score, kept, duplicate in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if kept not in used and duplicate not in used:
+            used.update([kept, duplicate])
+            duplicates.append((kept, duplicate, round(score, 2)))
+    order = {node: i for i, node in enumerate(nodes)}
+    return sorted(duplicates, key=lambda duplicate: order[duplicate[0]]) # in the order of the first file
+
+def merge_duplicates(tree, merges):
+    """
+    Merges individuals of a combined tree: each duplicate is replaced by the individual it is merged into,
+    who gets the families, parents and connections of both.
 
     input:
-    :gedcom_parser: Parsed GEDCOM file.
-    :translator: dictionary of short ID to long ID.
+    :tree: combined tree (see combine_trees).
+    :merges: dictionary of long ID of a duplicate to the long ID it is merged into.
+
+    return:
+    :tree: new tree, with the same keys.
+    """
+    node = lambda key: merges.get(key, key)
+    dedupe = lambda members: list(dict.fromkeys(members))
+
+    people = dict(tree['people'])
+    for duplicate, kept in merges.items():
+        person = people.pop(tree['reverse_translator'][duplicate])
+        kept_pointer = tree['reverse_translator'][kept]
+        people[kept_pointer] = {**people[kept_pointer], 'fams': dedupe(people[kept_pointer]['fams'] + person['fams']), 'famc': dedupe(people[kept_pointer]['famc'] + person['famc']),
+                                'family_references': dedupe(people[kept_pointer]['family_references'] + person['family_references'])}
+
+    def connect(edges):
+        result = {}
+        for edge in edges:
+            edge = tuple(node(member) for member in edge)
+            if len(set(edge)) == len(edge):
+                result.setdefault(frozenset(edge), edge) # the same couple or parent-child from both files is one edge
+        return list(result.values())
+
+    parents = {}
+    for child, members in tree['parents'].items():
+        parents[node(child)] = dedupe(parents.get(node(child), []) + [node(parent) for parent in members])
+
+    return {
+        **tree,
+        'people': people,
+        'translator': {key: value for key, value in tree['translator'].items() if value not in merges},
+        'reverse_translator': {key: value for key, value in tree['reverse_translator'].items() if key not in merges},
+        'labels': {key: value for key, value in tree['labels'].items() if key not in merges},
+        'fams': {key: dedupe(node(member) for member in members) for key, members in tree['fams'].items()},
+        'famc': {key: dedupe(node(member) for member in members) for key, members in tree['famc'].items()},
+        'family_edges': {key: connect(edges) for key, edges in tree['family_edges'].items()},
+        'parents': parents,
+        'nodes': [key for key in tree['nodes'] if key not in merges],
+        'edges': connect(tree['edges']),
+        'changed': set(key for key in tree['nodes'] if key not in merges),
+    }
+
+def get_ancestors(parents, individual):
+    """
+    Gets a list of ancestors of a specified individual from the ancestor index.
+
+    input:
+    :parents: dictionary of long ID to the long IDs of their parents (see process_gedcom).
     :individual: long ID of individual
 
     return:
     :ancestors: list of long IDs of ancestors of the selected :individual:
     """
 
-    reverse_translator = {value: key for key, value in translator.items()}
-    ancestors = gedcom_parser.get_ancestors(gedcom_parser.get_element_dictionary()[reverse_translator[individual]]) #takes long ID to short ID, calls location in memory to get ancestors.
-    ancestors = [translator[ancestor.get_pointer()] for ancestor in ancestors] # gets short IDs (pointers) and turns them into long IDs
-    ancestors.insert(0, individual)
+    ancestors = [individual]
+    seen = {individual}
+    for node in ancestors: # the list grows while it is walked (breadth-first)
+        for parent in parents.get(node, []):
+            if parent not in seen:
+                seen.add(parent)
+                ancestors.append(parent)
     return ancestors
 
-def color_nodes(nodes, node_color, ancestors=None, ancestors_color=None, individual=None, individual_color=None, highlight_individual=None, highlight_individual_color=None):
+def get_descendants(parents, individual):
+    """
+    Gets a list of descendants of a specified individual from the ancestor index (children are found by inverting it).
+
+    input:
+    :parents: dictionary of long ID to the long IDs of their parents (see process_gedcom).
+    :individual: long ID of individual
+
+    return:
+    :descendants: list of long IDs of descendants of the selected :individual: (without the individual)
+    """
+    children = {}
+    for child, members in parents.items():
+        for parent in members:
+            children.setdefault(parent, []).append(child)
+
+    descendants = [individual]
+    seen = {individual}
+    for node in descendants: # breadth-first, as in get_ancestors
+        for child in children.get(node, []):
+            if child not in seen:
+                seen.add(child)
+                descendants.append(child)
+    return descendants[1:]
+
+def compute_distances(nodes, edges, center_node=None):
+    """
+    Distance (number of connections) of each individual from the root, by breadth-first search over the connections.
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :edges: list of connections (pairs and parent-child).
+    :center_node: long ID of the root (optional).
+
+    return:
+    :distances: dictionary of :nodes: to their distance from :center_node:, or None when not connected to it; in breadth-first order
+                (the root's tree first, then the other trees, each from its first individual in :nodes:).
+    """
+    neighbors = {node: [] for node in nodes}
+    for edge in edges:
+        if edge[0] in neighbors and edge[1] in neighbors:
+            neighbors[edge[0]].append(edge[1])
+            neighbors[edge[1]].append(edge[0])
+
+    distances = {}
+    for start in ([center_node] if center_node in neighbors else []) + nodes:
+        if start in distances:
+            continue
+        distances[start] = 0 if start == center_node else None
+        queue = [start]
+        for node in queue: # breadth-first, as in get_ancestors
+            for neighbor in neighbors[node]:
+                if neighbor not in distances:
+                    distances[neighbor] = None if distances[node] is None else distances[node] + 1
+                    queue.append(neighbor)
+    return distances
+
+def compute_kinship(parents, individual):
+    """
+    Blood relationship of each relative to an individual: all ancestors are found first (with their nearest generation), then one
+    breadth-first search goes only down to the children from all of them at once (so the search never passes through a spouse, and an
+    ancestor that is also a cousin, by pedigree collapse, stays an ancestor): :up: generations to the nearest common ancestor and
+    :down: generations from it (parents (1, 0), children (0, 1), siblings (1, 1), first cousins (2, 2), first cousins once removed (2, 3) or (3, 2)...).
+
+    input:
+    :parents: dictionary of long ID to the long IDs of their parents (see process_gedcom).
+    :individual: long ID of individual
+
+    return:
+    :kinship: dictionary of long IDs of the blood relatives (and :individual:) to (up, down), the closest relationship (smallest up + down) first.
+    """
+    children = {}
+    for child, members in parents.items():
+        for parent in members:
+            children.setdefault(parent, []).append(child)
+
+    generation = {individual: 0}
+    for node in get_ancestors(parents, individual): # breadth-first, so the first line reaching an ancestor is the shortest
+        for parent in parents.get(node, []):
+            generation.setdefault(parent, generation[node] + 1)
+
+    # Relatives by distance (up + down): each ancestor enters at its generation, descendants one step after the relative they come from
+    levels = {}
+    for node, up in generation.items():
+        levels.setdefault(up, []).append((node, up, 0))
+    kinship = {}
+    distance = 0
+    while distance in levels:
+        for node, up, down in levels[distance]:
+            kinship.setdefault(node, (up, down))
+        for node, up, down in levels[distance]:
+            for child in children.get(node, []):
+                if child not in kinship and child not in generation:
+                    kinship[child] = (up, down + 1)
+                    levels.setdefault(distance + 1, []).append((child, up, down + 1))
+        distance += 1
+    return kinship
+
+def compute_pedigree(parents, individual):
+    """
+    Pedigree collapse (implex) of an individual, by dynamic programming over the parent DAG in topological order (children before parents):
+    each ancestor receives the number of ancestral lines reaching it per generation from its children, so every ancestor and every
+    parent link is visited once, instead of enumerating lines (which double with each generation).
+
+    input:
+    :parents: dictionary of long ID to the long IDs of their parents (see process_gedcom).
+    :individual: long ID of individual
+
+    return:
+    :pedigree: dictionary with
+        :generations: list of (generation, theoretical ancestors, known lines, distinct ancestors), from generation 1 (parents).
+        :ancestors: number of distinct ancestors.
+        :lines: number of known ancestral lines (a line is a path from the individual to an ancestor).
+        :implex: percentage of known lines that lead to an ancestor already reached by another line (pedigree collapse).
+        :depth: deepest known generation.
+        :loops: ancestors left out because they are their own ancestors (errors in the file).
+    """
+    ancestors = get_ancestors(parents, individual)
+    pending = {node: 0 for node in ancestors} # children not processed yet, within the ancestors
+    for node in ancestors:
+        for parent in set(parents.get(node, [])):
+            pending[parent] += 1
+
+    lines = {individual: {0: 1}} # ancestor -> {generation: number of lines}
+    order = [individual]
+    for node in order: # the list grows while it is walked (topological order)
+        for parent in set(parents.get(node, [])):
+            counts = lines.setdefault(parent, {})
+            for generation, count in lines[node].items():
+                counts[generation + 1] = counts.get(generation + 1, 0) + count
+            pending[parent] -= 1
+            if pending[parent] == 0 and parent != individual:
+                order.append(parent)
+
+    known, distinct = {}, {}
+    for node in order[1:]:
+        for generation, count in lines[node].items():
+            known[generation] = known.get(generation, 0) + count
+            distinct[generation] = distinct.get(generation, 0) + 1
+
+    total = sum(known.values())
+    return {
+        'generations': [(generation, 2 ** generation, known[generation], distinct[generation]) for generation in sorted(known)],
+        'ancestors': len(order) - 1,
+        'lines': total,
+        'implex': 100 * (1 - (len(order) - 1) / total) if total else 0,
+        'depth': max(known, default=0),
+        'loops': len(ancestors) - len(order),
+    }
+
+def color_nodes(nodes, node_color, ancestors=None, ancestors_color=None, individual=None, individual_color=None, highlight_individual=None, highlight_individual_color=None, distances=None):
     """
     Defines colors for general nodes, ancestor nodes, and the selected individual node.
 
@@ -258,12 +919,22 @@ def color_nodes(nodes, node_color, ancestors=None, ancestors_color=None, individ
     :ancestors_color: color for ancestor nodes (optional).
     :individual: list of long IDs of the selected individual (optional)
     :individual_color: color for the selected individual nodes (optional).
+    :distances: dictionary of long IDs to their distance from :individual: (optional), colored on a scale from :individual_color: (closest)
+                towards :node_color: (farthest); individuals without a distance keep :node_color:.
 
     return:
     :node_color: dictionary of all individuals and their respective color.
     """
+    base_color = node_color
     node_color = dict.fromkeys(nodes, node_color)
 
+    if distances and individual_color:
+        # One color per distance, the farthest still a step away from :node_color: so relatives stand out from the others
+        start, end = np.array(mcolors.to_rgb(individual_color)), np.array(mcolors.to_rgb(base_color))
+        steps = max(distances.values()) + 1
+        scale = [mcolors.to_hex(start + (end - start) * distance / steps) for distance in range(steps)]
+        node_color.update({node: scale[distance] for node, distance in distances.items() if node in node_color})
+
     if ancestors and ancestors_color:
         node_color.update({ancestor: ancestors_color for ancestor in ancestors if ancestor in node_color})
     
@@ -275,7 +946,31 @@ def color_nodes(nodes, node_color, ancestors=None, ancestors_color=None, individ
     
     return node_color
 
-def create_network(nodes, labels, base_node_color, edges, bg_color, center_node):
+def network_profile(node_count, edge_count):
+    """
+    Chooses the vis.js rendering profile of a 2D network from its size.
+
+    input:
+    :node_count: number of nodes.
+    :edge_count: number of connections.
+
+    return:
+    :profile: dictionary with
+        :name: "small", "large" or "huge".
+        :stabilization: stabilization iterations before the first drawing, from scratch (warm starts use at most WARM_START_STABILIZATION; 0 for none).
+        :iterations: physics iterations once every node is drawn, after which the physics is turned off (nodes can still be moved; None to keep it on).
+        :improved_layout: whether vis.js improves the initial layout (quadratic in the number of nodes).
+        :smooth: whether edges are drawn as curves (dynamic curves add a physics body per edge).
+        :labels: whether labels are always drawn (otherwise only when zoomed in, and on hover).
+    """
+    size = max(node_count, edge_count / 2)
+    if size <= LARGE_NETWORK:
+        return {"name": "small", "stabilization": 1000, "iterations": None, "improved_layout": True, "smooth": True, "labels": True}
+    if size <= HUGE_NETWORK:
+        return {"name": "large", "stabilization": 0, "iterations": LARGE_NETWORK_ITERATIONS, "improved_layout": False, "smooth": False, "labels": False}
+    return {"name": "huge", "stabilization": 0, "iterations": HUGE_NETWORK_ITERATIONS, "improved_layout": False, "smooth": False, "labels": False}
+
+def create_network(nodes, labels, base_node_color, edges, bg_color, center_node, pos2d=None, physics=True, hubs=None, clusters=None, profile=None):
     """
     Creates network visualization.
 
@@ -286,9 +981,17 @@ def create_network(nodes, labels, base_node_color, edges, bg_color, center_node)
     :edges: list of connections (pairs and parent-child).
     :bg_color: color for the background.
     :center_node: node from which the concentric circles start.
+    :pos2d: dictionary of long IDs and 2D coordinates to start the physics from (optional, replaces the concentric circles).
+    :physics: if False, nodes stay at :pos2d: (e.g. timeline).
+    :hubs: set of :nodes: drawn as small unlabeled family points (optional, see compute_family_overview).
+    :clusters: list of (list of :nodes:, label) collapsed into super-nodes, opened by clicking them (optional).
+    :profile: rendering profile (optional, chosen from the size of the network by network_profile).
+    
+    Individuals are sent nearest to the root first: the first PROGRESSIVE_FIRST are drawn at once and the others are added in batches
+    (without :clusters:, which need all their members from the start).
 
     return:
-    :network: network with the data of interest
+    :network_html: HTML page of the network with the data of interest (generated in memory, so concurrent sessions do not share a file)
     """
 
     #### This function is somehow working even when the center_node is None. 
@@ -299,35 +1002,240 @@ def create_network(nodes, labels, base_node_color, edges, bg_color, center_node)
         notebook=True, height="800px", width="100%", bgcolor=bg_color, cdn_resources="in_line"
     )
 
-    net.set_options('{"physics": {"solver": "barnesHut"}}')
+    if profile is None:
+        profile = network_profile(len(nodes), len(edges))
+
+    if not physics:
+        net.set_options('{"physics": {"enabled": false}, "edges": {"smooth": false}}')
+    else:
+        # Starting from an already computed layout, the physics only has to settle it
+        iterations = profile['stabilization'] if pos2d is None else min(profile['stabilization'], WARM_START_STABILIZATION)
+        net.set_options(json.dumps({
+            "physics": {"solver": "barnesHut", "stabilization": {"iterations": iterations} if iterations else {"enabled": False}},
+            "layout": {"improvedLayout": profile['improved_layout']},
+            **({} if profile['smooth'] else {"edges": {"smooth": False}}),
+        }))
 
     net.options['nodes'] = {
+        'shape': 'dot',
         'font': {
             'face': 'sans-serif'  # Set font family to sans-serif
         }
     }
+    if not profile['labels']:
+        # Drawing thousands of multi-line labels at every frame is what makes large networks slow: they appear when zoomed in, and on hover
+        net.options['nodes']['scaling'] = {'label': {'drawThreshold': LABEL_DRAW_THRESHOLD}}
 
     # Create a dictionary for the positions
     pos = {}
 
-    # Set the position for the center node
-    pos[center_node] = (0, 0)
+    if pos2d is not None:
+        pos = pos2d
 
-    # Set the positions for the other nodes
-    for i, node in enumerate(nodes):
-        if node == center_node:
-            continue
-        angle = 2 * np.pi * i / len(nodes)
-        pos[node] = (np.cos(angle), np.sin(angle))
+    else:
+        # Set the position for the center node
+        pos[center_node] = (0, 0)
 
-    # Add nodes with color, labels, and positions
-    for node in nodes:
-        net.add_node(node, label=labels[node], color=base_node_color[node], font={"color": base_node_color[node]}, x=pos[node][0]*1000, y=pos[node][1]*1000)
+        # Set the positions for the other nodes
+        for i, node in enumerate(nodes):
+            if node == center_node:
+                continue
+            angle = 2 * np.pi * i / len(nodes)
+            pos[node] = (np.cos(angle), np.sin(angle))
 
-    net.add_edges(edges)
     #net.show_buttons()
-    network = net.show("gedcom.html")
-    return network
+    network_html = net.generate_html(notebook=True)
+
+    # Nodes (with color, labels, and positions) and edges are sent in a compact form and built in the browser, nearest to the root first
+    nodes = list(compute_distances(nodes, edges, center_node))
+    first = len(nodes) if clusters else PROGRESSIVE_FIRST
+    network_html = network_html.replace("nodes = new vis.DataSet([]);\n", encode_network(nodes, labels, base_node_color, edges, pos, hubs, clusters, first, 
+                                        hover=not profile['labels']), 1)
+    network_html = network_html.replace("edges = new vis.DataSet([]);\n", "", 1)
+    if clusters:
+        # Clusters are made right after the network is created, so the physics only has to lay out the super-nodes
+        network_html = network_html.replace("network = new vis.Network(container, data, options);\n", "network = new vis.Network(container, data, options);\n" + CLUSTER_SCRIPT, 1)
+    else:
+        network_html = network_html.replace("network = new vis.Network(container, data, options);\n", "network = new vis.Network(container, data, options);\n" + PROGRESSIVE_SCRIPT, 1)
+    if physics and profile['iterations'] is not None:
+        network_html = network_html.replace("network = new vis.Network(container, data, options);\n", 
+                                            "network = new vis.Network(container, data, options);\n" + FREEZE_SCRIPT % (profile['iterations'], profile['iterations']), 1)
+
+    return network_html
+
+def encode_palette(nodes, base_node_color):
+    """
+    Encodes node colors as indices into a palette of the distinct colors.
+
+    return:
+    :palette: list of distinct colors.
+    :indices: list of palette indices, one per node.
+    """
+    palette = list(dict.fromkeys(base_node_color[node] for node in nodes))
+    position = {color: i for i, color in enumerate(palette)}
+    return palette, [position[base_node_color[node]] for node in nodes]
+
+def encode_network(nodes, labels, base_node_color, edges, pos, hubs=None, clusters=None, first=None, hover=False):
+    """
+    Encodes the 2D network as a compact JavaScript payload, decoded by the browser into vis.js nodes and edges:
+    integer IDs, label lines (names, places, dates) stored once and referenced by index, colors as palette indices,
+    and positions rounded to whole pixels.
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :labels: dictionary, with :nodes: as keys, and values as strings with name, place of birth and date of birth of the individuals.
+    :base_node_color: dictionary of all individuals and their respective color.
+    :edges: list of connections (pairs and parent-child).
+    :pos: dictionary of long IDs and 2D coordinates (multiplied by 1000 for vis.js).
+    :hubs: set of :nodes: drawn as small unlabeled family points (optional).
+    :clusters: list of (list of :nodes:, label) for CLUSTER_SCRIPT (optional).
+    :first: number of :nodes: in the first drawing, the others are added by PROGRESSIVE_SCRIPT (optional, all by default).
+    :hover: if True, labels are also shown on hover (for labels only drawn when zoomed in).
+
+    return:
+    :script: JavaScript that creates the `nodes` and `edges` datasets.
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = sorted(edges, key=lambda edge: max(index[edge[0]], index[edge[1]])) # an edge is drawn with the later of its two ends
+    strings = {}
+    lines = [[strings.setdefault(line, len(strings)) for line in labels[node].split(" \n ")] for node in nodes]
+    palette, colors = encode_palette(nodes, base_node_color)
+    payload = {
+        "strings": list(strings),
+        "lines": lines,
+        "palette": palette,
+        "colors": colors,
+        "x": [round(pos[node][0] * 1000) for node in nodes],
+        "y": [round(pos[node][1] * 1000) for node in nodes],
+        "edges": [index[node] for edge in edges for node in edge[:2]],
+        "hubs": sorted(index[node] for node in hubs or []),
+        "clusters": [{
+            "members": [index[node] for node in members],
+            "label": label,
+            "color": max(set(colors[index[node]] for node in members), key=[colors[index[node]] for node in members].count), # most common color
+        } for members, label in clusters or []],
+        "first": len(nodes) if first is None else min(first, len(nodes)),
+        "batch": PROGRESSIVE_BATCH,
+        "hover": hover,
+    }
+    return """var payload = %s;
+                  var hubs = new Set(payload.hubs);
+                  var nodeList = payload.colors.map(function (c, i) {
+                      if (hubs.has(i)) {
+                          return {id: i, color: payload.palette[c], size: %d, x: payload.x[i], y: payload.y[i]};
+                      }
+                      var label = payload.lines[i].map(function (j) { return payload.strings[j]; }).join(" \\n ");
+                      return {id: i, label: label, title: payload.hover ? label : undefined, color: payload.palette[c], font: {color: payload.palette[c]}, x: payload.x[i], y: payload.y[i]};
+                  });
+                  var edgeList = [];
+                  for (var k = 0; k < payload.edges.length; k += 2) {
+                      edgeList.push({from: payload.edges[k], to: payload.edges[k + 1]});
+                  }
+                  // Edges come ordered by their later end, so the ones between the first nodes are a prefix
+                  var shownNodes = payload.first, shownEdges = 0;
+                  while (shownEdges < edgeList.length && Math.max(edgeList[shownEdges].from, edgeList[shownEdges].to) < shownNodes) {
+                      shownEdges++;
+                  }
+                  nodes = new vis.DataSet(nodeList.slice(0, shownNodes));
+                  edges = new vis.DataSet(edgeList.slice(0, shownEdges));
+""" % (json.dumps(payload, separators=(",", ":")).replace("</", "<\\/"), FAMILY_HUB_SIZE) # no closing tags inside the script
+
+CLUSTER_SCRIPT = """
+                  // Collapse each branch into a super-node, sized by the number of individuals in it; a click opens it
+                  payload.clusters.forEach(function (cluster, k) {
+                      var members = new Set(cluster.members);
+                      network.cluster({
+                          joinCondition: function (node) { return members.has(node.id); },
+                          clusterNodeProperties: {id: "cluster:" + k, label: cluster.label, shape: "dot", size: 10 + 2 * Math.sqrt(cluster.members.length),
+                                                  color: payload.palette[cluster.color], font: {color: payload.palette[cluster.color]}}
+                      });
+                  });
+                  network.on("selectNode", function (params) {
+                      if (params.nodes.length == 1 && network.isCluster(params.nodes[0])) {
+                          network.openCluster(params.nodes[0]);
+                      }
+                  });
+                  network.stabilize();
+"""
+
+FREEZE_SCRIPT = """
+                  // Large networks: once every node is drawn, the physics stops when stable or after %d iterations (one per frame),
+                  // so the page stays idle (nodes can still be moved)
+                  var physicsFrames = 0, frozen = false;
+                  function freeze() {
+                      if (!frozen && nodes.length == payload.colors.length) {
+                          frozen = true;
+                          network.setOptions({physics: {enabled: false}});
+                      }
+                  }
+                  network.on("stabilized", freeze);
+                  network.on("afterDrawing", function () {
+                      if (nodes.length == payload.colors.length && ++physicsFrames >= %d) {
+                          freeze();
+                      }
+                  });
+"""
+
+PROGRESSIVE_SCRIPT = """
+                  // The root's neighborhood is already drawn, the farther individuals (and their edges) are added one batch per frame
+                  function addBatch() {
+                      var limit = Math.min(shownNodes + payload.batch, nodeList.length);
+                      var start = shownEdges;
+                      while (shownEdges < edgeList.length && Math.max(edgeList[shownEdges].from, edgeList[shownEdges].to) < limit) {
+                          shownEdges++;
+                      }
+                      nodes.add(nodeList.slice(shownNodes, limit));
+                      edges.add(edgeList.slice(start, shownEdges));
+                      shownNodes = limit;
+                      if (shownNodes < nodeList.length) {
+                          window.requestAnimationFrame(addBatch);
+                      }
+                  }
+                  if (shownNodes < nodeList.length) {
+                      window.requestAnimationFrame(addBatch);
+                  }
+"""
+
+def compute_family_overview(tree, nodes):
+    """
+    Family overview: each family becomes a hub node connected to its parents and children (instead of a pair edge and an edge per
+    parent and child), so the connections grow with the number of individuals; families where a hub would not save connections keep their edges.
+    The resulting graph is split into branches (Louvain communities) that can be collapsed into super-nodes.
+
+    input:
+    :tree: processed file (see process_gedcom).
+    :nodes: list of long IDs of all individuals
+
+    return:
+    :overview: dictionary with
+        :hubs: list of family pointers used as hub nodes.
+        :edges: list of (long ID, family pointer) and (long ID, long ID) connections.
+        :branches: list of lists of long IDs and family pointers, largest first.
+        :labels: list of branch labels (most common surname and number of individuals).
+    """
+    shown = set(nodes)
+    hubs, edges = [], []
+    for family in dict.fromkeys(list(tree['fams']) + list(tree['famc'])):
+        members = [node for node in dict.fromkeys(tree['fams'].get(family, []) + tree['famc'].get(family, [])) if node in shown]
+        family_edges = [edge for edge in tree['family_edges'].get(family, []) if edge[0] in shown and edge[1] in shown]
+        if len(members) < len(family_edges):
+            hubs.append(family)
+            edges += [(node, family) for node in members]
+        else:
+            edges += family_edges
+
+    G = nx.Graph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    branches = sorted((sorted(branch) for branch in nx.community.louvain_communities(G, seed=1)), key=lambda branch: (-len(branch), branch[0]))
+
+    labels = []
+    for branch in branches:
+        surnames = [tree['people'][tree['reverse_translator'][node]]['surname'] for node in branch if node in tree['reverse_translator']]
+        surname = max(set(filter(None, surnames)) or {""}, key=surnames.count)
+        labels.append(f"{surname} ({len(surnames)})".strip())
+
+    return {'hubs': hubs, 'edges': edges, 'branches': branches, 'labels': labels}
 
 def darken_color(color, amount=0.5):
     """
@@ -343,116 +1251,338 @@ def darken_color(color, amount=0.5):
                   c[2] * (1 - amount),
                   c[3]))
 
-def plot_3d_network(nodes, edges, labels, base_node_color, bg_color):
-    # Create a networkx graph
+def separate_overlaps(data_dict, threshold_distance=0.0080):
+    """
+    Lifts nodes that ended up on top of each other (closer than :threshold_distance:) by 0.01 in z.
+
+    input:
+    :data_dict: dictionary of long IDs and their 3D coordinates (updated in place).
+
+    return:
+    :data_dict: the same dictionary.
+    """
+    names = list(data_dict.keys())
+    vectors = np.array(list(data_dict.values()))
+
+    # Only the close pairs are needed, a KD-tree finds them without computing all pairwise distances
+    for i, j in sorted(cKDTree(vectors).query_pairs(threshold_distance)):
+        # Update z-coordinate of the first of the pair by adding 0.01
+        data_dict[names[i]] = data_dict[names[i]] + np.array([0.0, 0.0, 0.01])
+
+    return data_dict
+
+def find_components(nodes, edges):
+    """
+    Splits the tree into its connected components (disconnected trees, including individuals without any connection).
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :edges: list of connections (pairs and parent-child).
+
+    return:
+    :components: list of lists of long IDs, largest component first.
+    """
     G = nx.Graph()
+    G.add_nodes_from(nodes)
     G.add_edges_from(edges)
+    return sorted((sorted(component) for component in nx.connected_components(G)), key=lambda component: (-len(component), component[0]))
 
-    # Compute Fruchterman-Reingold layout for 3D graphs
-    if 'pos3d' not in st.session_state:
-        st.session_state['pos3d'] = nx.fruchterman_reingold_layout(G, dim=3, seed=9)
-        
-        data_dict = st.session_state['pos3d']
+@st.cache_resource
+def get_layout_pool():
+    # Worker processes are forked: Streamlit installs the running script as the __main__ module, which spawned (or forkserver) workers 
+    # import first, so they would run the whole app. Where fork is not available layouts run in the app process.
+    if LAYOUT_WORKERS < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return ProcessPoolExecutor(max_workers=LAYOUT_WORKERS, mp_context=multiprocessing.get_context("fork"))
 
-        # Extract names and vectors from dictionary
-        names = list(data_dict.keys())
-        vectors = list(data_dict.values())
+def reset_layout_pool(pool):
+    """
+    Drops a pool whose worker died (e.g. killed when out of memory), as every later job would fail: the next layouts start a new one.
+    """
+    pool.shutdown(wait=False, cancel_futures=True)
+    get_layout_pool.clear()
 
-        # Compute pairwise distances
-        pairwise_distances = pdist(vectors)
+def pack_components(layouts, gap=0.5):
+    """
+    Packs component layouts in rows (largest first) on the x-y plane. Each component is scaled 
+    by the cube root of its size, so that all components are drawn at the same density.
 
-        # Convert to square distance matrix
-        distance_matrix = squareform(pairwise_distances)
+    input:
+    :layouts: list of dictionaries of long IDs and their 3D coordinates (each roughly within [-1, 1]), largest component first.
+    :gap: space between components.
 
-        # Get indices of upper triangle (excluding diagonal) of distance matrix
-        upper_triangle_indices = np.triu_indices(len(names), k=1)
+    return:
+    :data_dict: dictionary of long IDs and their 3D coordinates, scaled to [-1, 1].
+    """
+    radii = [len(layout) ** (1 / 3) for layout in layouts]
+    row_width = np.sqrt(sum((2 * radius + gap) ** 2 for radius in radii))
+
+    data_dict = {}
+    x, y, row_height = 0, 0, 0
+    for layout, radius in zip(layouts, radii):
+        if x > 0 and x + 2 * radius > row_width: # start a new row
+            x, y, row_height = 0, y + row_height + gap, 0
+        row_height = max(row_height, 2 * radius)
+        offset = np.array([x + radius, y + radius, 0])
+        for node, coordinates in layout.items():
+            data_dict[node] = np.asarray(coordinates) * radius + offset
+        x += 2 * radius + gap
+
+    if not data_dict:
+        return data_dict
+    vectors = np.array(list(data_dict.values()))
+    center = (vectors.max(axis=0) + vectors.min(axis=0)) / 2
+    scale = max(np.abs(vectors - center).max(), 1e-9)
+    return {node: (coordinates - center) / scale for node, coordinates in data_dict.items()}
+
+def compute_3d_layout(edges, nodes=None, previous_pos=None, changed=None):
+    """
+    Computes the 3D Fruchterman-Reingold layout and separates nodes that ended up on top of each other.
+    Each connected component is laid out on its own (large ones in parallel worker processes), then the components are packed.
 
-        # Create list of (distance, name1, name2) tuples
-        distance_name_pairs = [
-            (distance_matrix[i, j], names[i], names[j])
-            for i, j in zip(upper_triangle_indices[0], upper_triangle_indices[1])
-        ]
+    With the positions of a previous version of the tree, components without changes keep their layout and the others are 
+    warm-started from it (see warm_start).
 
-        # Sort distance_name_pairs by distance
-        #distance_name_pairs.sort()
+    input:
+    :edges: list of connections (pairs and parent-child).
+    :nodes: list of long IDs of all individuals (optional, includes individuals without connections).
+    :previous_pos: dictionary of long IDs and their previous 3D coordinates (optional).
+    :changed: set of long IDs that are new or changed compared to :previous_pos:.
 
-        # Display closest pairs and distances
-        #print("Closest pairs (sorted by distance):")
-        #for distance, name1, name2 in distance_name_pairs:
-        #    print(f"{name1} and {name2}: Distance = {distance:.4f}")
-            
-        # Update coordinates based on distance condition
-        threshold_distance = 0.0080
-        for distance, name1, name2 in distance_name_pairs:
-            if distance < threshold_distance:
-                # Check if name1 exists in data_dict
-                if name1 in data_dict:
-                    # Get current coordinates of name1
-                    current_vector = data_dict[name1]
-                    # Update z-coordinate by adding 0.01
-                    updated_vector = current_vector + np.array([0.0, 0.0, 0.01])
-                    # Update data_dict with the updated_vector
-                    data_dict[name1] = updated_vector
-
-        # Print updated data dictionary
-        #print("\nUpdated data dictionary:")
-        #for name, vector in data_dict.items():
-        #    print(f"{name}: {vector}")
-        #print(data_dict == st.session_state['pos3d']) # check if the pointer is working correctly.
+    return:
+    :data_dict: dictionary of long IDs and their 3D coordinates.
+    """
+    # Create a networkx graph
+    G = nx.Graph()
+    G.add_nodes_from(nodes or [])
+    G.add_edges_from(edges)
 
-    else:
-        pass
+    components = find_components(list(G), edges)
+    layouts = []
+    jobs = {}
+    # Worker processes only pay off with more than one large component
+    pool = get_layout_pool() if sum(len(component) >= PARALLEL_COMPONENT_SIZE for component in components) > 1 else None
+    for i, component in enumerate(components):
+        subgraph = G.subgraph(component).copy()
+        if len(component) == 1:
+            layouts.append({component[0]: np.zeros(3)})
+            continue
 
-    # Extract node positions
-    node_x = [st.session_state['pos3d'][node][0] for node in nodes]
-    node_y = [st.session_state['pos3d'][node][1] for node in nodes]
-    node_z = [st.session_state['pos3d'][node][2] for node in nodes]
+        # Compute Fruchterman-Reingold layout for 3D graphs
+        args = {"dim": 3, "seed": 9}
+        seed = warm_start(subgraph, previous_pos, changed or set()) if previous_pos else None
+        if seed is not None:
+            pos, fixed = seed
+            if len(fixed) == len(component): # unchanged component
+                layouts.append(pos)
+                continue
+            args.update(pos=pos, fixed=fixed, iterations=WARM_START_ITERATIONS)
+
+        if pool is not None and len(component) >= PARALLEL_COMPONENT_SIZE:
+            try:
+                jobs[i] = (pool.submit(nx.fruchterman_reingold_layout, subgraph, **args), subgraph, args)
+                layouts.append(None)
+                continue
+            except BrokenProcessPool:
+                reset_layout_pool(pool)
+                pool = None
+        layouts.append(nx.fruchterman_reingold_layout(subgraph, **args))
+
+    for i, (job, subgraph, args) in jobs.items():
+        try:
+            layouts[i] = job.result()
+        except BrokenProcessPool:
+            # The pool broke while laying out: the components it did not finish are laid out here
+            if pool is not None:
+                reset_layout_pool(pool)
+                pool = None
+            layouts[i] = nx.fruchterman_reingold_layout(subgraph, **args)
+
+    # Layouts with fixed nodes are not rescaled by networkx, the packing expects each component within [-1, 1]
+    layouts = [nx.rescale_layout_dict(layout) if len(layout) > 1 else layout for layout in layouts]
+    return separate_overlaps(pack_components(layouts))
+
+def compute_generations(nodes, parents):
+    """
+    Computes the generation depth of each individual (0 for those without known parents, otherwise one more than their deepest parent).
 
-    labels = {key: value.replace(" \n ", "<br>") for key, value in labels.items()}
+    input:
+    :nodes: list of long IDs of all individuals
+    :parents: dictionary of long ID to the long IDs of their parents (see process_gedcom).
 
-    # Create edges trace
-    edge_x = []
-    edge_y = []
-    edge_z = []
+    return:
+    :generations: dictionary of long IDs and their generation depth.
+    """
+    generations = {}
+    for node in nodes:
+        stack = [node]
+        while stack: # depth-first, each individual is resolved once
+            current = stack[-1]
+            pending = [parent for parent in parents.get(current, []) if parent not in generations and parent not in stack]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            generations[current] = max((generations.get(parent, -1) for parent in parents.get(current, [])), default=-1) + 1
+    return generations
+
+def project_to_2d(pos3d):
+    """
+    Projects a 3D layout on the plane that shows most of its spread (principal components), scaled to a unit radius.
 
-    #edge_colors = [[('red', 'blue'), ('yellow', 'green')], ['black']*(len(edges)-2)]
-    #edge_colors = [item for sublist in edge_colors for item in sublist]
+    input:
+    :pos3d: dictionary of long IDs and their 3D coordinates.
 
-    edge_colors = []
-    for edge in edges:
-        for ind in edge:
-            if ind in base_node_color:
-                edge_colors.append(base_node_color[ind])
-            #else:
-            #    result_list.append('')
-        edge_colors.append(bg_color)  # Append an empty string after each tuple
+    return:
+    :pos2d: dictionary of long IDs and their 2D coordinates.
+    """
+    names = list(pos3d.keys())
+    vectors = np.array(list(pos3d.values()))
+    vectors = vectors - vectors.mean(axis=0)
+    _, _, components = np.linalg.svd(vectors, full_matrices=False)
+    projected = vectors @ components[:2].T
+    projected /= max(np.abs(projected).max(), 1e-9)
+    return dict(zip(names, map(tuple, projected)))
+
+def recenter(pos, center_node):
+    """
+    Translates a layout so that :center_node: is at the origin (nothing else moves relative to each other).
 
-    for edge in edges:
-        x0, y0, z0 = st.session_state['pos3d'][edge[0]]
-        x1, y1, z1 = st.session_state['pos3d'][edge[1]]
-        edge_x += [x0, x1, None]
-        edge_y += [y0, y1, None]
-        edge_z += [z0, z1, None]
-        #edge_colors.append(base_node_color[edge[0]])
+    input:
+    :pos: dictionary of long IDs and their coordinates.
+    :center_node: long ID of the new center (if None, or not in the layout, :pos: is returned as is).
 
-    line_color = []
-    for color in list(base_node_color.values()):
-        line_color.append(darken_color(color, 0.2))
+    return:
+    :pos: dictionary of long IDs and their translated coordinates.
+    """
+    if center_node is None or center_node not in pos:
+        return pos
+    origin = np.asarray(pos[center_node])
+    return {node: tuple(np.asarray(coordinates) - origin) for node, coordinates in pos.items()}
+
+def warm_start(G, previous_pos, changed):
+    """
+    Starting positions of a component from the layout of a previous version of the tree.
+    Individuals far from any change stay where they were; new and changed individuals (and their relatives) 
+    start next to their already placed relatives and settle in a few iterations.
+
+    input:
+    :G: graph of the component.
+    :previous_pos: dictionary of long IDs and their previous 3D coordinates (packed with the other components).
+    :changed: set of long IDs that are new or changed.
+
+    return:
+    :pos: dictionary of long IDs and their starting 3D coordinates, within [-1, 1] as a component laid out on its own.
+    :fixed: list of long IDs that keep their position.
+    (None if no individual keeps its position, the component is laid out from scratch)
+    """
+    moving = {node for node in G if node in changed or node not in previous_pos}
+    moving |= {neighbor for node in moving for neighbor in G[node]}
+    fixed = [node for node in G if node not in moving]
+    if not fixed:
+        return None
+
+    # Back to the scale of the component on its own (pack_components scaled and moved it)
+    pos = nx.rescale_layout_dict({node: np.asarray(previous_pos[node], dtype=float) for node in G if node in previous_pos})
+
+    # Place new individuals next to their placed relatives (breadth-first from the known positions)
+    rng = np.random.default_rng(9)
+    queue = [node for node in G if node not in pos]
+    while queue:
+        pending = []
+        for node in queue:
+            placed = [pos[neighbor] for neighbor in G[node] if neighbor in pos]
+            if placed:
+                pos[node] = np.mean(placed, axis=0) + rng.normal(scale=0.01, size=3)
+            else:
+                pending.append(node)
+        if len(pending) == len(queue): # not connected to anything placed
+            for node in pending:
+                pos[node] = rng.uniform(-1, 1, size=3)
+            break
+        queue = pending
+
+    return pos, fixed
+
+def plot_3d_network(nodes, edges, labels, base_node_color, bg_color, pos3d, center_node=None, extent=None, steps=PAYLOAD_STEPS):
+    """
+    Creates the 3D network visualization.
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :edges: list of connections (pairs and parent-child).
+    :labels: dictionary, with :nodes: as keys, and values as strings with name, place of birth and date of birth of the individuals.
+    :base_node_color: dictionary of all individuals and their respective color.
+    :bg_color: color for the background.
+    :pos3d: dictionary of long IDs and their 3D coordinates (see compute_3d_layout).
+    :center_node: long ID the camera is centered on and rotates around (optional).
+    :extent: long IDs whose positions set the axes and camera (optional, :nodes: by default), so partial figures keep the view of the whole.
+    :steps: number of integer steps across the widest axis of :extent: (optional), at least one per distinct position along an axis.
+
+    return:
+    :fig: plotly figure
+    """
+    # Positions are sent as integers (:steps: steps across the widest axis, counted from the corner of :extent:), which keeps the JSON
+    # sent to the browser short; the axes are hidden and the camera is set relative to the data, so the scale makes no difference on screen
+    bounds = np.array([pos3d[node] for node in (nodes if extent is None else extent)], dtype=float).reshape(-1, 3)
+    low, high = (bounds.min(axis=0), bounds.max(axis=0)) if len(bounds) else (np.zeros(3), np.ones(3))
+    scale = steps / max((high - low).max(), 1e-9)
+    vectors = np.rint((np.array([pos3d[node] for node in nodes], dtype=float).reshape(-1, 3) - low) * scale).astype(int).tolist()
+    position = dict(zip(nodes, vectors))
+    node_x, node_y, node_z = zip(*vectors) if vectors else ([], [], [])
+
+    labels = {node: labels[node].replace(" \n ", "<br>") for node in nodes}
+
+    # Colors are sent once per palette entry, nodes only carry their palette index
+    palette, indices = encode_palette(nodes, base_node_color)
+    palette = [mcolors.to_hex(color) for color in palette]
+    line_palette = [mcolors.to_hex(darken_color(color, 0.2)) for color in palette]
+    color_index = dict(zip(nodes, indices))
 
     # Create figure
     fig = go.Figure()
 
-    # Add edges trace
-    fig.add_trace(go.Scatter3d(
-        x=edge_x,
-        y=edge_y,
-        z=edge_z,
-        mode='lines',
-        line=dict(width=7, color=edge_colors),
-        hoverinfo='none'
-    ))
+    # Add edges traces, one per pair of end colors: a constant color, or a gradient between the two ends
+    edge_groups = {}
+    for edge in edges:
+        key = (color_index[edge[0]], color_index[edge[1]])
+        if key[0] > key[1]:
+            key, edge = key[::-1], (edge[1], edge[0])
+        edge_groups.setdefault(key, []).append(edge)
+
+    for (a, b), group in edge_groups.items():
+        edge_x, edge_y, edge_z = [], [], []
+        for edge in group:
+            x0, y0, z0 = position[edge[0]]
+            x1, y1, z1 = position[edge[1]]
+            edge_x += [x0, x1, None]
+            edge_y += [y0, y1, None]
+            edge_z += [z0, z1, None]
+
+        if a == b:
+            line = dict(width=7, color=palette[a])
+        else:
+            line = dict(width=7, color=[0, 1, 0] * len(group), colorscale=[[0, palette[a]], [1, palette[b]]], cmin=0, cmax=1)
+
+        fig.add_trace(go.Scatter3d(
+            x=edge_x,
+            y=edge_y,
+            z=edge_z,
+            mode='lines',
+            line=line,
+            hoverinfo='none'
+        ))
 
     # Add nodes trace
+    if len(palette) > 1:
+        marker_color = dict(color=indices, cmin=0, cmax=len(palette) - 1,
+                            colorscale=[[i / (len(palette) - 1), color] for i, color in enumerate(palette)])
+        line_color = dict(color=indices, cmin=0, cmax=len(palette) - 1,
+                          colorscale=[[i / (len(palette) - 1), color] for i, color in enumerate(line_palette)])
+    else:
+        marker_color = dict(color=palette[0] if palette else bg_color)
+        line_color = dict(color=line_palette[0] if palette else bg_color)
+
     fig.add_trace(go.Scatter3d(
         x=node_x,
         y=node_y,
@@ -460,9 +1590,9 @@ def plot_3d_network(nodes, edges, labels, base_node_color, bg_color):
         mode='markers',
         marker=dict(symbol='circle',
                     size=5,
-                    color=list(base_node_color.values()),
-                    line=dict(color=line_color, width=2)),
-        hovertext=list(labels.values()),
+                    line=dict(width=2, **line_color),
+                    **marker_color),
+        hovertext=[labels[node] for node in nodes],
         hoverinfo='text'
     ))
 
@@ -482,8 +1612,886 @@ def plot_3d_network(nodes, edges, labels, base_node_color, bg_color):
         margin = {'l':0,'r':0,'t':0,'b':0}
     )
 
+    if extent is not None:
+        # Fixed axes (with a small margin for the markers), so the view does not move as the rest of :extent: is added
+        margin = 0.02 * (high - low) * scale + 1
+        fig.update_layout(scene=dict(
+            xaxis_range=[-margin[0], (high[0] - low[0]) * scale + margin[0]],
+            yaxis_range=[-margin[1], (high[1] - low[1]) * scale + margin[1]],
+            zaxis_range=[-margin[2], (high[2] - low[2]) * scale + margin[2]],
+        ))
+
+    if center_node in pos3d:
+        # Recenter on the root: the camera keeps its default angle but looks at (and rotates around) the root
+        center = (np.asarray(pos3d[center_node]) - (low + high) / 2) / np.maximum(high - low, 1e-9)
+        fig.update_layout(scene_aspectmode='cube', scene_camera=dict(
+            center=dict(x=center[0], y=center[1], z=center[2]),
+            eye=dict(x=center[0] + 1.25, y=center[1] + 1.25, z=center[2] + 1.25)
+        ))
+
     return fig
 
+def progressive_batches(nodes, edges, center_node=None):
+    """
+    Splits the network into growing parts for progressive rendering: the PROGRESSIVE_FIRST individuals nearest to the root first,
+    then PROGRESSIVE_GROWTH times more at each step, until the whole network. Parts larger than 1/PROGRESSIVE_GROWTH of the network 
+    are left out (the whole network comes next), so at most 1/(PROGRESSIVE_GROWTH - 1) more is sent in total.
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :edges: list of connections (pairs and parent-child).
+    :center_node: long ID of the root (optional).
+
+    return:
+    :batches: list of (list of long IDs, list of connections between them), the last one being :nodes: and :edges:.
+    """
+    order = {node: i for i, node in enumerate(compute_distances(nodes, edges, center_node))}
+    batches = []
+    size = PROGRESSIVE_FIRST
+    while size * PROGRESSIVE_GROWTH <= len(nodes):
+        batches.append(([node for node in order if order[node] < size], [edge for edge in edges if max(order[edge[0]], order[edge[1]]) < size]))
+        size *= PROGRESSIVE_GROWTH
+    batches.append((nodes, edges))
+    return batches
+
+def progressive_payload(fig, batches):
+    """
+    Bytes sent by progressive rendering, serializing only the last figure (the whole network): 
+    the partial figures are counted by their share of its individuals and connections.
+
+    input:
+    :fig: figure of the last batch.
+    :batches: list of (list of long IDs, list of connections) sent (see progressive_batches).
+
+    return:
+    :size: estimated bytes of all the figures.
+    """
+    whole = len(batches[-1][0]) + len(batches[-1][1]) or 1
+    return round(len(fig.to_json().encode()) * sum(len(batch_nodes) + len(batch_edges) for batch_nodes, batch_edges in batches) / whole)
+
+PLACE_STOPWORDS = {"of", "in", "at", "near", "nr", "the", "abt", "about", "bef", "aft", "co", "county", "parish", "st", "castle", "palace", "hosp", "hospital", "church"}
+
+PLACE_ABBREVIATIONS = {"st": "saint", "ste": "sainte"} # expanded before another word ("St. Petersburg", not "Main St.")
+
+def normalize_place(text):
+    """
+    Normalizes a place name for lookups: accents removed, lowercase, only alphanumeric tokens separated by single spaces, 
+    and abbreviations (PLACE_ABBREVIATIONS) expanded.
+    """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    tokens = re.findall(r"[a-z0-9]+", text)
+    return " ".join([PLACE_ABBREVIATIONS.get(token, token) for token in tokens[:-1]] + tokens[-1:])
+
+class Gazetteer:
+    """
+    Offline gazetteer (GeoNames extract, see gazetteer/readme.txt) with a normalized name index, and an on-disk cache of resolved places.
+
+    Place strings are read as comma separated components, most specific first (e.g. "Springfield, Sangamon, Illinois, USA").
+    Components that name a country or a first-level division narrow down which of the cities with the same name is meant, 
+    and a city named further down the place is where to look first: the more specific component is taken if it is within 
+    GEOCODE_HINT_KM of it (the nearest one), otherwise the city itself is (unless the city is a namesake in another country). 
+    If no component is a known city, the place falls back to the (population weighted) center of the most specific region named.
+    """
+
+    def __init__(self, directory, cache_path):
+        self.lock = threading.Lock()
+        self.cache_path = cache_path
+
+        # Cities, most populated first so that the first match of a name is the most likely one
+        with gzip.open(os.path.join(directory, 'cities.tsv.gz'), 'rt', encoding='utf-8') as file:
+            rows = [line.rstrip('\n').split('\t') for line in file][1:]
+        rows.sort(key=lambda row: -int(row[6]))
+        self.country = [row[2] for row in rows]
+        self.admin1 = [row[3] for row in rows]
+        self.coordinates = np.array([(float(row[4]), float(row[5])) for row in rows])
+        population = np.array([int(row[6]) for row in rows], dtype=float)
+
+        self.index = {} # normalized name -> list of city rows
+        self.tokens = {} # normalized token -> list of (city row, normalized name)
+        for i, row in enumerate(rows):
+            for name in {normalize_place(name) for name in [row[0]] + row[1].split('|') if name}:
+                self.index.setdefault(name, []).append(i)
+                for token in name.split():
+                    self.tokens.setdefault(token, []).append((i, name))
+
+        # Regions: countries and first-level divisions, by name, alias, and ISO code
+        self.regions = {} # normalized name -> list of (country, admin1 or None)
+        with open(os.path.join(directory, 'countries.tsv'), encoding='utf-8') as file:
+            for iso, iso3, name, aliases in (line.rstrip('\n').split('\t') for line in list(file)[1:]):
+                for alias in [iso, iso3, name] + aliases.split('|'):
+                    if alias:
+                        self.regions.setdefault(normalize_place(alias), []).append((iso, None))
+        with open(os.path.join(directory, 'admin1.tsv'), encoding='utf-8') as file:
+            for country, code, name, aliases in (line.rstrip('\n').split('\t') for line in list(file)[1:]):
+                for alias in [name, code if country == 'US' else None] + aliases.split('|'):
+                    if alias:
+                        self.regions.setdefault(normalize_place(alias), []).append((country, code))
+
+        self.centroids = {} # (country, admin1 or None) -> population weighted center
+        keys = [(country, None) for country in self.country] + list(zip(self.country, self.admin1))
+        weights = np.concatenate([population, population])
+        coordinates = np.concatenate([self.coordinates, self.coordinates])
+        order = {key: i for i, key in enumerate(dict.fromkeys(keys))}
+        groups = np.array([order[key] for key in keys])
+        sums = np.zeros((len(order), 2))
+        np.add.at(sums, groups, coordinates * weights[:, None])
+        totals = np.bincount(groups, weights=weights, minlength=len(order))
+        for key, i in order.items():
+            self.centroids[key] = tuple(sums[i] / totals[i]) if totals[i] else None
+
+        # Resolved places survive restarts, the cache is dropped if the gazetteer or the way places are resolved changes
+        self.version = f"{os.path.getsize(os.path.join(directory, 'cities.tsv.gz'))}-{GEOCODE_VERSION}"
+        self.cache = {}
+        try:
+            with open(cache_path, encoding='utf-8') as file:
+                cache = json.load(file)
+            if cache.get('version') == self.version:
+                self.cache = cache['places']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def resolve(self, place):
+        """
+        Resolves one place string.
+
+        input:
+        :place: place string as found in the GEDCOM file.
+
+        return:
+        :coordinates: (latitude, longitude), or None if the place is not found.
+        """
+        components = [component for component in map(normalize_place, place.split(',')) if component]
+        regions = [self.regions[component] for component in components if component in self.regions]
+
+        def within(row, region):
+            return any(country == self.country[row] and admin1 in (None, self.admin1[row]) for country, admin1 in region)
+
+        def distance(row, other):
+            # kilometers, on the plane tangent at the cities (enough to tell neighbours from namesakes)
+            (latitude, longitude), (other_latitude, other_longitude) = self.coordinates[row], self.coordinates[other]
+            return 111.2 * np.hypot(latitude - other_latitude, (longitude - other_longitude) * np.cos(np.radians(latitude)))
+
+        # words like "Castle" are not places on their own
+        components = [component for component in components if set(component.split()) - PLACE_STOPWORDS]
+
+        # the most populated city of each component, in every region named in the place (a region is not taken for its namesake city, 
+        # e.g. "Buffalo, New York" is not near New York City)
+        cities = [next((row for row in self.index.get(component, [])[:500] if all(within(row, region) for region in regions)), None)
+                  if component not in self.regions else None for component in components]
+
+        for i, component in enumerate(components):
+            rows = self.index.get(component)
+            if rows is None:
+                # the component may hold more than the city name (e.g. "Westminster Abbey"), try the names made of its tokens
+                words = set(component.split()) - PLACE_STOPWORDS
+                rows = [row for token in words for row, name in self.tokens.get(token, []) if set(name.split()) <= words]
+            # the city has to be in every region named in the place
+            rows = [row for row in rows[:500] if all(within(row, region) for region in regions)]
+            # and near the city named further down, if any (e.g. "Kensington Palace, London" is not the Kensington of Liverpool)
+            hint = next((city for city in cities[i + 1:] if city is not None), None)
+            if hint is not None and rows:
+                near = sorted((row for row in rows if distance(row, hint) <= GEOCODE_HINT_KM), key=lambda row: distance(row, hint))
+                if near:
+                    return tuple(self.coordinates[near[0]])
+                if any(self.country[row] == self.country[hint] for row in rows):
+                    continue # a part of the city that is not in the gazetteer: the city itself is taken
+                # otherwise the city is a namesake in another country (e.g. "Eltham, Kent" is not near Kent, Washington)
+            if rows:
+                return tuple(self.coordinates[rows[0]]) # the most populated (rows are sorted by population)
+
+        for region in regions: # most specific region first
+            for key in sorted(region, key=lambda key: key[1] is None):
+                if self.centroids.get(key):
+                    return self.centroids[key]
+        return None
+
+    def geocode(self, places):
+        """
+        Resolves all places in one batch: each distinct place is looked up once, the cache is saved once.
+
+        input:
+        :places: list of place strings.
+
+        return:
+        :coordinates: dictionary of place string to (latitude, longitude) or None.
+        """
+        keys = {place: ", ".join(filter(None, map(normalize_place, place.split(',')))) for place in set(places) if place}
+        with self.lock:
+            missing = {key for key in keys.values() if key not in self.cache}
+            for key in missing:
+                self.cache[key] = self.resolve(key)
+            if missing:
+                self.save()
+            return {place: tuple(self.cache[key]) if self.cache[key] else None for place, key in keys.items()}
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.cache_path), delete=False, encoding='utf-8') as file:
+                json.dump({'version': self.version, 'places': self.cache}, file)
+            os.replace(file.name, self.cache_path)
+        except OSError:
+            pass # the cache is only an optimization
+
+@st.cache_resource
+def get_gazetteer():
+    return Gazetteer(GAZETTEER_DIR, GEOCODE_CACHE)
+
+def plot_map(nodes, labels, base_node_color, bg_color, places, coordinates):
+    """
+    Creates the map visualization (WebGL markers, clustered when they overlap).
+
+    input:
+    :nodes: list of long IDs of all individuals
+    :labels: dictionary, with :nodes: as keys, and values as strings with name, place of birth and date of birth of the individuals.
+    :base_node_color: dictionary of all individuals and their respective color.
+    :bg_color: color for the background.
+    :places: dictionary of long IDs and their place of birth.
+    :coordinates: dictionary of place string to (latitude, longitude) or None (see Gazetteer.geocode).
+
+    return:
+    :fig: plotly figure
+    :placed: number of individuals placed on the map.
+    """
+    located = [node for node in nodes if coordinates.get(places.get(node))]
+    latitudes = [coordinates[places[node]][0] for node in located]
+    longitudes = [coordinates[places[node]][1] for node in located]
+
+    colors = [base_node_color[node] for node in located] or ["#FFFFFF"]
+
+    fig = go.Figure(go.Scattermapbox(
+        lat=latitudes,
+        lon=longitudes,
+        mode='markers',
+        marker=dict(size=9, color=colors[:len(located)]),
+        hovertext=[labels[node].replace(" \n ", "<br>") for node in located],
+        hoverinfo='text',
+        cluster=dict(enabled=True, color=mcolors.to_hex(darken_color(max(set(colors), key=colors.count), 0.2)), opacity=0.9, step=[20, 100], size=[16, 22, 30]),
+    ))
+
+    # Map style follows the background, tiles are drawn by the browser (no geocoding service is used)
+    dark = sum(mcolors.to_rgb(bg_color)) < 1.5
+    fig.update_layout(
+        showlegend=False,
+        mapbox=dict(
+            style="carto-darkmatter" if dark else "carto-positron",
+            center=dict(lat=float(np.mean(latitudes)) if located else 0, lon=float(np.mean(longitudes)) if located else 0),
+            zoom=1.5,
+        ),
+        paper_bgcolor=bg_color,
+        height=800,
+        margin={'l':0,'r':0,'t':0,'b':0}
+    )
+
+    return fig, len(located)
+
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+DATE_PATTERN = re.compile(
+    r"(?:(ABT|ABOUT|CAL|EST|BEF|BEFORE|AFT|AFTER|BET|BETWEEN|FROM|TO|INT)\.?\s+)?" # qualifier
+    r"(?:\d{1,2}\s+)?(?:(" + "|".join(MONTHS) + r")[A-Z]*\.?\s+)?" # day and month
+    r"\b(\d{1,4})\b(?!\s*(?:" + "|".join(MONTHS) + r"))(?:/(\d{1,4}))?(\s*B\.?\s?C\.?)?" # year, dual year (1699/00), BC
+    r"(?:\s+(?:AND|TO)\s+(?:\d{1,2}\s+)?(?:[A-Z]{3}[A-Z]*\.?\s+)?(\d{1,4})|\s*[-–]\s*(\d{3,4})\b(?!\s*[-–]))?" # second year of a range (not 1850-03-12)
+    r"(\s*B\.?\s?C\.?)?" # BC for the second year
+)
+
+def parse_years(dates, cache):
+    """
+    Estimates numeric years from GEDCOM date phrases (ABT, BEF, AFT, BET...AND, FROM...TO, 1800-1805, dual years, partial dates, BC).
+    Each distinct string is parsed once (and kept in :cache:), the estimates are then combined as arrays.
+
+    input:
+    :dates: list of date strings.
+    :cache: dictionary of date string to year estimate, shared between files.
+
+    return:
+    :years: numpy array of year estimates (NaN where no year could be read).
+    """
+    unique = [date for date in set(dates) if date not in cache]
+    if unique:
+        matches = [DATE_PATTERN.search(" ".join(date.upper().split())) for date in unique]
+        fields = [match.groups() if match else (None,) * 8 for match in matches]
+        qualifier, month, year, dual, bc, second, dashed, second_bc = (np.array(column, dtype=object) for column in zip(*fields))
+        second = np.where(second == None, dashed, second)
+
+        number = lambda column: np.array([float(value) if value else np.nan for value in column])
+        years = number(year)
+
+        # dual years: 1699/00 and 1515/6 are 1700 and 1516, 1456/1457 is 1457
+        digits = np.array([len(value) if value else 0 for value in dual])
+        dual_year = years - years % 10.0 ** digits + number(dual)
+        dual_year = np.where(dual_year < years, dual_year + 10.0 ** digits, dual_year)
+        years = np.where(digits > 0, dual_year, years)
+
+        years += np.array([(MONTHS.index(value) + 0.5) / 12 if value else 0.5 for value in month])
+        # the era applies to each year of a range, BC only given for the second one applies to both (BET 100 AND 50 BC)
+        years = np.where((bc != None) | (second_bc != None), -years, years)
+
+        ranges = number(second) + 0.5
+        ranges = np.where(second_bc != None, -ranges, ranges)
+        years = np.where(np.isnan(ranges), years, (years + ranges) / 2)
+        years += np.where(np.isin(qualifier, ["BEF", "BEFORE", "TO"]) & np.isnan(ranges), -DATE_MARGIN, 0)
+        years += np.where(np.isin(qualifier, ["AFT", "AFTER", "FROM"]) & np.isnan(ranges), DATE_MARGIN, 0)
+
+        if len(cache) > 500000:
+            cache.clear()
+        cache.update(zip(unique, years))
+
+    return np.array([cache[date] for date in dates], dtype=float)
+
+@st.cache_resource
+def get_date_cache():
+    return {}
+
+def compute_timeline_layout(tree, nodes, parents):
+    """
+    Computes a timeline layout in linear time, without any force simulation: birth year on one axis,
+    family order (individuals next to their spouses, children right after their parents) and generation on the others.
+    Missing years are estimated from parents, then children, then the generation.
+
+    input:
+    :tree: processed file (see process_gedcom).
+    :nodes: list of long IDs of all individuals
+    :parents: dictionary of long ID to the long IDs of their parents.
+
+    return:
+    :timeline: dictionary of long IDs and their (year, family order, generation).
+    """
+    people = {node: tree['people'][tree['reverse_translator'][node]] for node in nodes}
+    years = dict(zip(nodes, parse_years([people[node]['birth_date'] for node in nodes], get_date_cache())))
+    generations = compute_generations(nodes, parents)
+    by_generation = sorted(nodes, key=generations.get)
+
+    children = {}
+    for child in nodes:
+        for parent in parents.get(child, []):
+            children.setdefault(parent, []).append(child)
+
+    # Fill in missing years: from the parents (oldest generations first), then from the children (youngest first)
+    for node in by_generation:
+        known = [years[parent] for parent in parents.get(node, []) if not np.isnan(years.get(parent, np.nan))]
+        if np.isnan(years[node]) and known:
+            years[node] = np.mean(known) + GENERATION_YEARS
+    for node in reversed(by_generation):
+        known = [years[child] for child in children.get(node, []) if not np.isnan(years[child])]
+        if np.isnan(years[node]) and known:
+            years[node] = min(known) - GENERATION_YEARS
+    known = [node for node in nodes if not np.isnan(years[node])]
+    reference = np.median([years[node] - generations[node] * GENERATION_YEARS for node in known]) if known else 0
+    for node in nodes:
+        if np.isnan(years[node]):
+            years[node] = reference + generations[node] * GENERATION_YEARS
+
+    # Family order: depth-first from the oldest individuals, spouses next to each other, children by year
+    order = {}
+    for start in by_generation:
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node in order:
+                continue
+            order[node] = len(order)
+            family_children = []
+            for family in people[node]['fams']:
+                for spouse in tree['fams'].get(family, []):
+                    if spouse not in order and spouse in people:
+                        order[spouse] = len(order)
+                family_children += [child for child in tree['famc'].get(family, []) if child in people]
+            stack.extend(sorted(set(family_children), key=years.get, reverse=True))
+
+    return {node: (years[node], order[node], generations[node]) for node in nodes}
+
+class SearchIndex:
+    """
+    Search index over the individuals of a file (name, ID and place of birth), built once per file.
+    Words of 3 or more characters are looked up by trigrams (matching anywhere in a word), shorter ones by word prefix.
+    """
+
+    def __init__(self, nodes, places):
+        """
+        input:
+        :nodes: list of long IDs of all individuals (name and ID).
+        :places: dictionary of long IDs and their place of birth.
+        """
+        self.nodes = sorted(nodes) # alphabetical order is also the order of the results
+        self.positions = {node: i for i, node in enumerate(self.nodes)}
+        self.ids = {re.sub(r"^I0*", "I", node[node.rfind("(") + 1:-1]): node for node in self.nodes} # I01 and I1 are both I1
+        self.texts = [normalize_place(node + " " + places.get(node, "")) for node in self.nodes]
+
+        self.trigrams = {}
+        words = set()
+        for i, text in enumerate(self.texts):
+            for word in set(text.split()):
+                words.add((word, i))
+                for start in range(len(word) - 2):
+                    postings = self.trigrams.setdefault(word[start:start + 3], [])
+                    if not postings or postings[-1] != i:
+                        postings.append(i)
+        self.words = sorted(words)
+
+    def match(self, token):
+        """
+        Returns the set of positions (in :nodes:) whose text contains :token: (3 or more characters) or a word starting with it.
+        """
+        if len(token) < 3:
+            start = bisect.bisect_left(self.words, (token,))
+            end = bisect.bisect_left(self.words, (token + "\uffff",))
+            return {i for _, i in self.words[start:end]}
+
+        postings = sorted((self.trigrams.get(token[start:start + 3], []) for start in range(len(token) - 2)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {i for i in candidates if token in self.texts[i]}
+
+    def search(self, query, limit=SEARCH_RESULTS):
+        """
+        Finds the individuals matching every word of :query:. Exact word matches of the first word (e.g. an ID) come first, then texts starting with it.
+
+        input:
+        :query: text typed by the user.
+        :limit: maximum number of results.
+
+        return:
+        :results: list of long IDs.
+        """
+        tokens = normalize_place(query).split()
+        if not tokens:
+            return self.nodes[:limit]
+
+        found = self.match(tokens[0])
+        for token in tokens[1:]:
+            if not found:
+                break
+            found &= self.match(token)
+
+        ranked = heapq.nsmallest(limit, found, key=lambda i: (tokens[0] not in self.texts[i].split(), not self.texts[i].startswith(tokens[0]), i))
+        return [self.nodes[i] for i in ranked]
+
+def select_individual(container, label, search_index, state_key, default=None, exclude=None):
+    """
+    Typeahead selector: a search box, and a selectbox with only the best matches (and the current choice).
+
+    input:
+    :container: streamlit container for the widgets.
+    :label: label of the selectbox.
+    :search_index: SearchIndex of the file.
+    :state_key: session state key that keeps the choice between reruns.
+    :default: long ID chosen when nothing was chosen yet (optional, otherwise the first individual).
+    :exclude: long ID that cannot be chosen (optional).
+
+    return:
+    :selected: long ID of the chosen individual.
+    """
+    query = container.text_input("Search by name, ID or place of birth", key=f"{state_key}_query")
+    options = [node for node in search_index.search(query, SEARCH_RESULTS + 1) if node != exclude][:SEARCH_RESULTS]
+
+    current = st.session_state.get(state_key)
+    if current not in search_index.positions or current == exclude:
+        current = default if default in search_index.positions and default != exclude else (options or [None])[0]
+    if current is not None and current not in options:
+        options = [current] + options[:SEARCH_RESULTS - 1]
+
+    selected = container.selectbox(label, options, index=options.index(current) if current in options else 0)
+    st.session_state[state_key] = selected
+    return selected
+
+def project_view(pos3d, azimuth=45, elevation=30):
+    """
+    Orthographic projection of a 3D layout as seen by a camera (similar to the default 3D view).
+
+    input:
+    :pos3d: dictionary of long IDs and their 3D coordinates.
+    :azimuth: camera angle around the vertical axis, in degrees.
+    :elevation: camera angle above the horizontal plane, in degrees.
+
+    return:
+    :pos2d: dictionary of long IDs and their 2D coordinates.
+    :depth: dictionary of long IDs and their distance along the camera direction (larger is closer).
+    """
+    names = list(pos3d.keys())
+    vectors = np.array(list(pos3d.values()), dtype=float).reshape(-1, 3)
+    a, e = np.radians(azimuth), np.radians(elevation)
+    eye = np.array([np.cos(e) * np.cos(a), np.cos(e) * np.sin(a), np.sin(e)])
+    right = np.cross([0, 0, 1], eye)
+    right /= np.linalg.norm(right)
+    up = np.cross(eye, right)
+    return dict(zip(names, map(tuple, vectors @ np.array([right, up]).T))), dict(zip(names, vectors @ eye))
+
+def export_image(zip_file, name, pos2d, nodes, edges, labels, base_node_color, bg_color, file_format="png", width=4000, height=4000, show_labels=True, depth=None):
+    """
+    Draws the network with matplotlib (no browser involved) from node positions and colors, into :zip_file:.
+    PNG images larger than EXPORT_TILE_PIXELS are split into tiles, each drawn on its own canvas and written to the archive 
+    as soon as it is drawn (only one tile is in memory at a time).
+
+    input:
+    :zip_file: zipfile.ZipFile open for writing.
+    :name: file name of the image in the archive, without extension (tiles get their row and column added).
+    :pos2d: dictionary of long IDs and their 2D coordinates (see project_view for 3D layouts).
+    :nodes: list of long IDs of the individuals drawn.
+    :edges: list of connections (pairs and parent-child).
+    :labels: dictionary of long IDs and their labels (only the name, the first line, is drawn).
+    :base_node_color: dictionary of all individuals and their respective color (see color_nodes).
+    :bg_color: color for the background.
+    :file_format: "png", "svg" or "pdf".
+    :width: and :height: size of the image, in pixels.
+    :show_labels: whether names are drawn next to the nodes.
+    :depth: dictionary of long IDs and their depth (optional, closer nodes are drawn on top).
+
+    return:
+    :files: list of the file names written to :zip_file:, one per tile.
+    """
+    nodes = [node for node in nodes if node in pos2d]
+    if depth is not None:
+        nodes = sorted(nodes, key=depth.get)
+    xy = np.array([pos2d[node] for node in nodes], dtype=float).reshape(-1, 2)
+    xy[:, 1] *= -1 if depth is None else 1 # 2D layouts (as vis.js) have y pointing down
+
+    # Fit the layout in the image, keeping its proportions
+    low, high = (xy.min(axis=0), xy.max(axis=0)) if len(xy) else (np.zeros(2), np.ones(2))
+    center, span = (low + high) / 2, np.maximum(high - low, 1e-9) * 1.05
+    scale = max(span[0] / width, span[1] / height) # layout units per pixel
+    extent = np.array([width, height]) * scale
+
+    node_size = float(np.clip(min(width, height) / np.sqrt(max(len(nodes), 1)) / 4, 2, 24)) # pixels
+    positions = dict(zip(nodes, xy))
+    segments = [(positions[a], positions[b]) for a, b in edges if a in positions and b in positions]
+
+    tiles_x = 1 if file_format != "png" else int(np.ceil(width / EXPORT_TILE_PIXELS))
+    tiles_y = 1 if file_format != "png" else int(np.ceil(height / EXPORT_TILE_PIXELS))
+    tile_width, tile_height = width / tiles_x, height / tiles_y
+
+    fig = Figure(figsize=(tile_width / EXPORT_DPI, tile_height / EXPORT_DPI), dpi=EXPORT_DPI, facecolor=bg_color)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_facecolor(bg_color)
+    ax.set_axis_off()
+    ax.add_collection(LineCollection(segments, colors=[base_node_color.get(a, "#888888") for a, b in edges if a in positions and b in positions], linewidths=max(node_size / 8, 0.5), alpha=0.5, zorder=1))
+    ax.scatter(xy[:, 0], xy[:, 1], s=(node_size * 72 / EXPORT_DPI) ** 2, c=[base_node_color[node] for node in nodes], edgecolors=[darken_color(base_node_color[node], 0.2) for node in nodes], linewidths=0.5, zorder=2)
+    names = [labels[node].split(" \n ")[0] for node in nodes] if show_labels else []
+    if names and file_format != "png":
+        font_size = node_size * 0.6 * 72 / EXPORT_DPI
+        for label, node, (x, y) in zip(names, nodes, xy):
+            ax.text(x, y - node_size * scale, label, fontsize=font_size, color=base_node_color[node], ha="center", va="top", zorder=3)
+    elif names:
+        # Raster labels are drawn with PIL on top of the rendered image, much faster than matplotlib text for thousands of labels
+        font = ImageFont.truetype(font_manager.findfont("DejaVu Sans"), max(int(node_size * 0.6), 1))
+        label_colors = [mcolors.to_hex(base_node_color[node]) for node in nodes]
+
+    files = []
+    canvas = FigureCanvasAgg(fig)
+    for row in range(tiles_y):
+        for column in range(tiles_x):
+            left = center[0] - extent[0] / 2 + column * extent[0] / tiles_x
+            top = center[1] + extent[1] / 2 - row * extent[1] / tiles_y
+            ax.set_xlim(left, left + extent[0] / tiles_x)
+            ax.set_ylim(top - extent[1] / tiles_y, top)
+            suffix = f"_{row + 1}-{column + 1}" if tiles_x * tiles_y > 1 else ""
+            files.append(f"{name}{suffix}.{file_format}")
+            # PNG is already compressed, it is stored as is
+            entry = zipfile.ZipInfo(files[-1], time.localtime()[:6])
+            entry.compress_type = zipfile.ZIP_STORED if file_format == "png" else zipfile.ZIP_DEFLATED
+            if file_format == "png":
+                canvas.draw()
+                image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+                if names:
+                    pixels = ax.transData.transform(xy)
+                    pixels[:, 1] = image.height - pixels[:, 1] # PIL counts rows from the top
+                    draw = ImageDraw.Draw(image)
+                    for label, color, (x, y) in zip(names, label_colors, pixels):
+                        if -image.width < x < 2 * image.width and 0 < y + node_size < image.height + node_size:
+                            draw.text((x, y + node_size), label, fill=color, font=font, anchor="mt")
+                with zip_file.open(entry, "w", force_zip64=True) as file:
+                    image.save(file, format="png")
+            else:
+                with zip_file.open(entry, "w", force_zip64=True) as file:
+                    fig.savefig(file, format=file_format, facecolor=bg_color)
+    return files
+
+def estimate_size(obj):
+    """
+    Estimates the memory held by an object graph (containers, numpy arrays and instance attributes are followed, shared objects are counted once).
+
+    input:
+    :obj: any python object.
+
+    return:
+    :size: estimated size in bytes.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, (type, type(sys), type(estimate_size))):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o) # numpy arrays that own their data already include it here
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__') and not isinstance(o, np.ndarray):
+            stack.append(vars(o))
+    return size
+
+class ArtifactStore:
+    """
+    Shared store for heavy per-file objects (parsed trees, layouts), kept once per file hash for all sessions.
+
+    Sessions only reference a file hash. When the estimated total goes over the budget, the least recently used sessions are evicted,
+    idle sessions are evicted after :idle_timeout: seconds, and artifacts no longer referenced by any session are dropped.
+    An evicted session simply recomputes its artifacts on the next rerun.
+    """
+
+    def __init__(self, budget, idle_timeout):
+        self.budget = budget
+        self.idle_timeout = idle_timeout
+        self.lock = threading.RLock()
+        self.artifacts = {} # (file hash, name) -> [value, estimated bytes]
+        self.sessions = OrderedDict() # session id -> {"file": file hash, "last_seen": timestamp}, least recently used first
+        self.payloads = {} # view -> [bytes of the last render, largest render]
+
+    def touch(self, session_id, file_hash=None):
+        """
+        Marks the session as active and, if given, points it to :file_hash:.
+        """
+        with self.lock:
+            session = self.sessions.pop(session_id, {"file": None, "last_seen": 0})
+            session["last_seen"] = time.time()
+            if file_hash is not None:
+                session["file"] = file_hash
+            self.sessions[session_id] = session
+            self.evict(keep=session_id)
+
+    def get(self, file_hash, name):
+        with self.lock:
+            artifact = self.artifacts.get((file_hash, name))
+            return artifact[0] if artifact else None
+
+    def put(self, file_hash, name, value, session_id=None):
+        size = estimate_size(value)
+        with self.lock:
+            self.artifacts[(file_hash, name)] = [value, size]
+            self.evict(keep=session_id)
+        return value
+
+    def total(self):
+        return sum(size for _, size in self.artifacts.values())
+
+    def record_payload(self, view, size):
+        """
+        Records the size of a figure sent to the browser for :view:.
+        """
+        with self.lock:
+            largest = self.payloads.get(view, (0, 0))[1]
+            self.payloads[view] = [size, max(largest, size)]
+
+    def evict(self, keep=None):
+        """
+        Drops idle sessions, then least recently used sessions while over budget (never :keep:), then unreferenced artifacts.
+        """
+        now = time.time()
+        for session_id in [sid for sid, session in self.sessions.items() if sid != keep and now - session["last_seen"] > self.idle_timeout]:
+            del self.sessions[session_id]
+        self.release()
+
+        while self.total() > self.budget:
+            lru = next((sid for sid in self.sessions if sid != keep), None)
+            if lru is None:
+                break # only the active session is left, it keeps what it needs
+            del self.sessions[lru]
+            self.release()
+
+    def release(self):
+        referenced = {session["file"] for session in self.sessions.values()}
+        for key in [key for key in self.artifacts if key[0] not in referenced]:
+            del self.artifacts[key]
+
+    def report(self):
+        """
+        Returns the estimated bytes held per session and overall.
+
+        return:
+        :rows: list of dictionaries (one per session).
+        :total: estimated bytes held by the store.
+        :files: number of distinct files held.
+        """
+        with self.lock:
+            now = time.time()
+            sharing = {}
+            for session in self.sessions.values():
+                sharing[session["file"]] = sharing.get(session["file"], 0) + 1
+            rows = []
+            for session_id, session in reversed(self.sessions.items()):
+                held = sum(size for (file_hash, _), (_, size) in self.artifacts.items() if file_hash == session["file"])
+                rows.append({
+                    "session": session_id[:8],
+                    "file": (session["file"] or "")[:12],
+                    "estimated MB": round(held / 1024 ** 2, 2),
+                    "shared with": sharing.get(session["file"], 1) - 1,
+                    "idle (s)": int(now - session["last_seen"]),
+                })
+            return rows, self.total(), len({file_hash for file_hash, _ in self.artifacts})
+
+@st.cache_resource
+def get_artifact_store():
+    return ArtifactStore(MEMORY_BUDGET, SESSION_IDLE_TIMEOUT)
+
+def show_memory_report(store):
+    """
+    Admin view with the estimated memory held per session and overall.
+    """
+    rows, total, files = store.report()
+    admin = st.sidebar.expander(label=r"$\textbf{\textsf{\normalsize Memory usage}}$", expanded=True)
+    admin.metric("Artifacts held", f"{total / 1024 ** 2:.1f} MB", f"{total / store.budget:.0%} of {store.budget / 1024 ** 2:.0f} MB budget", delta_color="off")
+    admin.markdown(f"**Sessions:** {len(rows)} &nbsp; **Files:** {files}")
+    admin.dataframe(rows, use_container_width=True, hide_index=True)
+    if store.payloads:
+        admin.markdown(f"**Figure payloads** (budget {PAYLOAD_BUDGET / 1024:.0f} KB per render)")
+        admin.dataframe([{
+            "view": view,
+            "last KB": round(last / 1024, 1),
+            "largest KB": round(largest / 1024, 1),
+            "within budget": largest <= PAYLOAD_BUDGET,
+        } for view, (last, largest) in store.payloads.items()], use_container_width=True, hide_index=True)
+
+def relationship_distances(store, file_hash, session_id, tree, mode, root):
+    """
+    Distances from :root: for the relationship color scale, computed in one traversal and kept for the last RELATIONSHIP_ROOTS roots of the file,
+    so switching back and forth between roots does not recompute them.
+
+    input:
+    :mode: "Kinship degree" (generations up to the nearest common ancestor plus down from it, blood relatives only, see compute_kinship)
+           or "Connections" (number of connections, see compute_distances).
+
+    return:
+    :distances: dictionary of long IDs to their distance from :root:.
+    """
+    cache = store.get(file_hash, "relationships") or {}
+    if (mode, root) not in cache:
+        if mode == "Kinship degree":
+            distances = {node: up + down for node, (up, down) in compute_kinship(tree['parents'], root).items()}
+        else:
+            distances = {node: distance for node, distance in compute_distances(tree['nodes'], tree['edges'], root).items() if distance is not None}
+        cache = dict(list(cache.items())[-(RELATIONSHIP_ROOTS - 1):] + [((mode, root), distances)]) # oldest roots dropped
+        store.put(file_hash, "relationships", cache, session_id)
+    return cache[(mode, root)]
+
+def layout_3d(store, file_hash, session_id, tree):
+    """
+    3D layout of the file, computed and stored on first use. A re-uploaded file starts from the layout of its previous 
+    version (stored as "previous_pos3d" on upload).
+
+    return:
+    :pos3d: dictionary of long IDs and their 3D coordinates.
+    """
+    pos3d = store.get(file_hash, "pos3d")
+    if pos3d is None:
+        pos3d = store.put(file_hash, "pos3d", compute_3d_layout(tree['edges'], tree['nodes'], store.get(file_hash, "previous_pos3d"), tree['changed']), session_id)
+    return pos3d
+
+def export_layout(store, file_hash, session_id, tree, view):
+    """
+    2D positions of a view for the image export, from the layouts already computed for the file (computed and stored if missing).
+    The Classic (2D) view is exported from the 3D layout projected on a plane (its physics only runs in the browser).
+
+    return:
+    :pos2d: dictionary of long IDs and their 2D coordinates.
+    :depth: dictionary of long IDs and their depth for 3D views (None for 2D views).
+    """
+    nodes, parents = tree['nodes'], tree['parents']
+    if view in ["Timeline (2D)", "Timeline (3D)"]:
+        timeline = store.get(file_hash, "timeline")
+        if timeline is None:
+            timeline = store.put(file_hash, "timeline", compute_timeline_layout(tree, nodes, parents), session_id)
+        if view == "Timeline (2D)":
+            return {node: (year * TIMELINE_YEAR_WIDTH, order * TIMELINE_ROW_HEIGHT) for node, (year, order, generation) in timeline.items()}, None
+        coordinates = np.array(list(timeline.values()), dtype=float)
+        coordinates = (coordinates - coordinates.min(axis=0)) / np.maximum(np.ptp(coordinates, axis=0), 1)
+        return project_view(dict(zip(timeline.keys(), coordinates)))
+
+    pos2d = store.get(file_hash, "pos2d") if view == "Classic (2D)" else None
+    if pos2d is not None:
+        return pos2d, None
+    pos3d = layout_3d(store, file_hash, session_id, tree)
+    if view == "Classic (2D)":
+        return store.put(file_hash, "pos2d", project_to_2d(pos3d), session_id), None
+    return project_view(pos3d)
+
+def compute_artifacts(lines):
+    """
+    Computes the artifacts the views need for a file (the same as the app computes on demand).
+
+    input:
+    :lines: list of lines of the GEDCOM file (see read_gedcom).
+
+    return:
+    :artifacts: dictionary of artifact name (as in the ArtifactStore) to value, or None if the file cannot be processed.
+    """
+    errors, _ = validate_gedcom(lines)
+    if errors:
+        return None
+    tree = process_gedcom(lines)
+    if not tree['edges']:
+        return None
+    nodes, edges, parents = tree['nodes'], tree['edges'], tree['parents']
+    pos3d = compute_3d_layout(edges, nodes)
+    return {
+        "tree": tree,
+        "components": find_components(nodes, edges),
+        "search_index": SearchIndex(nodes, {node: tree['people'][tree['reverse_translator'][node]]['birth_place'] for node in nodes}),
+        "pos3d": pos3d,
+        "pos2d": project_to_2d(pos3d),
+        "timeline": compute_timeline_layout(tree, nodes, parents),
+        "overview": compute_family_overview(tree, nodes),
+    }
+
+def precompute_corpus(directory, output):
+    """
+    Build step: computes the artifacts of every GEDCOM file under :directory: and saves them in :output:, one file per content hash.
+    """
+    os.makedirs(output, exist_ok=True)
+    for root, _, file_names in sorted(os.walk(directory)):
+        for file_name in sorted(file_names):
+            if not file_name.lower().endswith(".ged"):
+                continue
+            with open(os.path.join(root, file_name), 'rb') as file:
+                data = file.read()
+            start = time.time()
+            try:
+                artifacts = compute_artifacts(read_gedcom(io.BytesIO(data)))
+            except (ValueError, GedcomFormatViolationError):
+                artifacts = None
+            if artifacts is None:
+                print(f"{file_name}: skipped, the file cannot be processed")
+                continue
+            with tempfile.NamedTemporaryFile('wb', dir=output, delete=False) as file:
+                with gzip.GzipFile(fileobj=file, mode='wb') as compressed:
+                    pickle.dump({'version': PRECOMPUTED_VERSION, 'artifacts': artifacts}, compressed, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(file.name, os.path.join(output, hashlib.sha256(data).hexdigest() + ".pkl.gz"))
+            print(f"{file_name}: {len(artifacts['tree']['nodes'])} individuals, {time.time() - start:.1f}s")
+
+def load_precomputed(file_hash):
+    """
+    Artifacts precomputed at build time for the file with this content hash (see precompute_corpus).
+
+    return:
+    :artifacts: dictionary of artifact name to value, or None if there are none (or they were computed by another version of the app).
+    """
+    path = os.path.join(PRECOMPUTED_DIR, f"{file_hash}.pkl.gz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, 'rb') as file:
+            precomputed = pickle.load(file) # written by the build step, not by users
+    except Exception:
+        return None # computed on demand instead
+    return precomputed['artifacts'] if precomputed.get('version') == PRECOMPUTED_VERSION else None
+
+if __name__ == "__main__" and "--precompute" in sys.argv:
+    # Build step (see Dockerfile), outside of streamlit: python app.py --precompute
+    precompute_corpus(os.path.join(BASE_DIR, 'gedcom_files'), PRECOMPUTED_DIR)
+    sys.exit(0)
+
 #### Streamlit app ####
 st.set_page_config(layout="wide", page_icon=favicon, initial_sidebar_state="expanded")
 
@@ -517,9 +2525,11 @@ with open(example2, 'rb') as file:
 
 upload_gedcom = st.sidebar.expander(label=r"$\textbf{\textsf{\normalsize Add GEDCOM}}$")
 
-uploaded_file = upload_gedcom.file_uploader("Upload a GEDCOM file", type=["ged"])
+uploaded_files = upload_gedcom.file_uploader("Upload a GEDCOM file (or several, to merge them)", type=UPLOAD_TYPES, accept_multiple_files=True,
+    help="Compressed files are accepted too: .ged.gz, .ged.bz2, .zip and GEDZIP (.gdz). They are decompressed while reading.")
+uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 
-if uploaded_file is None:
+if not uploaded_files:
     upload_gedcom.markdown("**Download example file:**")
     upload_gedcom.download_button(label="Example 1 (67 individuals)",
         data=example1_content,
@@ -532,41 +2542,118 @@ if uploaded_file is None:
 
 button_generate_network = None  # Initialize the button variable
 
-# Track the hash of the previously uploaded file content
-if 'previous_file_hash' not in st.session_state:
-    st.session_state['previous_file_hash'] = None
+# Heavy objects live in the shared store, the session only keeps the hash of its file
+store = get_artifact_store()
+session_id = get_script_run_ctx().session_id
+store.touch(session_id)
+
+if ADMIN_TOKEN and hmac.compare_digest(st.query_params.get("admin", "").encode(), ADMIN_TOKEN.encode()):
+    show_memory_report(store)
 
 # Handle file upload
 if uploaded_file is not None:
-    # Calculate the hash of the newly uploaded file content
+    # Calculate the hash of the newly uploaded file content (as uploaded: compressed files are not decompressed for it)
     st.session_state['new_file_hash'] = hashlib.sha256(uploaded_file.getvalue()[:]).hexdigest()
 
-    # Compare the hash of the newly uploaded file content with the hash of the previous file content
-    if st.session_state['new_file_hash'] != st.session_state['previous_file_hash']:
-        # Reset pos3d session state if the contents of the new file are different from the previous file
-        if 'pos3d' in st.session_state:
-            del st.session_state['pos3d']
-        
-        # Update the hash of the previous file content
-        st.session_state['previous_file_hash'] = st.session_state['new_file_hash']
+    # Keep the previous version of the tree at hand, an edited re-upload only reprocesses what changed
+    previous_tree = store.get(st.session_state.get('previous_file_hash'), "tree")
+    previous_pos3d = store.get(st.session_state.get('previous_file_hash'), "pos3d")
+    if previous_tree is not None and 'sources' in previous_tree:
+        previous_tree = None # merged files are not a previous version of a single file
+
+    # Point the session to the new file, artifacts of the previous file are released once no session uses them
+    store.touch(session_id, st.session_state['new_file_hash'])
 
+elif uploaded_files:
+    # Several files: each one is processed on its own, then combined, and probable duplicates are reviewed before merging
+    upload_hash = hashlib.sha256("".join(hashlib.sha256(file.getvalue()).hexdigest() for file in uploaded_files).encode()).hexdigest()
+
+if uploaded_files:
     try:
-        parser = parse_gedcom(uploaded_file)
+        if uploaded_file is not None:
+            tree = store.get(st.session_state['new_file_hash'], "tree")
+            precomputed = load_precomputed(st.session_state['new_file_hash']) if tree is None else None
+            if precomputed is not None:
+                # Bundled example: parsed tree and layouts come from the build step, nothing is computed
+                for name, value in precomputed.items():
+                    store.put(st.session_state['new_file_hash'], name, value, session_id)
+                tree = precomputed['tree']
+
+            elif tree is None:
+                tree = store.put(st.session_state['new_file_hash'], "tree", process_gedcom(read_gedcom(uploaded_file), previous_tree), session_id)
+
+                if previous_tree is not None and previous_pos3d is not None:
+                    # Carry the previous layout over, matched by record pointer as names (and long IDs) may have been edited.
+                    # The new layout starts from it when a 3D view needs it (see layout_3d)
+                    previous_pos = {tree['translator'][pointer]: previous_pos3d[node] for pointer, node in previous_tree['translator'].items() if pointer in tree['translator'] and node in previous_pos3d}
+                    store.put(st.session_state['new_file_hash'], "previous_pos3d", previous_pos, session_id)
+
+        else:
+            # The combined files and the duplicates found are kept while the review changes (each choice of merges is a different tree)
+            sources = store.get(st.session_state.get('previous_file_hash'), "sources")
+            if sources is None or sources['hash'] != upload_hash:
+                combined = combine_trees([process_gedcom(read_gedcom(file), name=file.name) for file in uploaded_files], [file.name for file in uploaded_files])
+                sources = {'hash': upload_hash, 'tree': combined, 'duplicates': find_duplicates(combined)}
+            combined, duplicates = sources['tree'], sources['duplicates']
+
+            merges = {}
+            if duplicates:
+                with st.expander(f"🔗 {len(duplicates)} probable duplicates found across the files", expanded=True):
+                    st.markdown("Checked individuals are merged into one (IDs of the second and following files start with the file number). Uncheck the ones that are different people.")
+                    birth = lambda node: ", ".join(filter(None, [combined['people'][combined['reverse_translator'][node]]['birth_date'], combined['people'][combined['reverse_translator'][node]]['birth_place']]))
+                    review = st.data_editor({
+                        "merge": [True] * len(duplicates),
+                        "individual": [kept for kept, _, _ in duplicates],
+                        "born": [birth(kept) for kept, _, _ in duplicates],
+                        "duplicate": [duplicate for _, duplicate, _ in duplicates],
+                        "duplicate born": [birth(duplicate) for _, duplicate, _ in duplicates],
+                        "similarity": [score for _, _, score in duplicates],
+                    }, disabled=["individual", "born", "duplicate", "duplicate born", "similarity"], hide_index=True, use_container_width=True, key=f"duplicates_{upload_hash[:16]}")
+                    merges = {duplicate: kept for (kept, duplicate, _), merge in zip(duplicates, review["merge"]) if merge}
+
+            st.session_state['new_file_hash'] = hashlib.sha256((upload_hash + "".join(sorted(merges))).encode()).hexdigest()
+            store.touch(session_id, st.session_state['new_file_hash'])
+            store.put(st.session_state['new_file_hash'], "sources", sources, session_id)
+            tree = store.get(st.session_state['new_file_hash'], "tree")
+            if tree is None:
+                tree = store.put(st.session_state['new_file_hash'], "tree", merge_duplicates(combined, merges), session_id)
 
-        translator, nodes, labels, edges = process_gedcom(parser)
+        st.session_state['previous_file_hash'] = st.session_state['new_file_hash']
+        translator, nodes, labels, edges, parents = tree['translator'], tree['nodes'], tree['labels'], tree['edges'], tree['parents']
 
         success = upload_gedcom.success("✅ Parsing successful.")
+        if tree['warnings']:
+            with st.expander(f"⚠️ {len(tree['warnings'])} problems were found in the file and skipped"):
+                st.markdown("\n".join(f"- {warning}" for warning in tree['warnings']))
         #sleep(1) # Wait for 1 seconds
         #success.empty() # Clear the alert
 
         views = st.sidebar.expander(label=r"$\textbf{\textsf{\normalsize Views}}$", expanded=True)
         views_sb = views.selectbox(label="Select a view", options=["Classic (2D)", 
             "3D", 
-            #"Map"
+            "Timeline (2D)", 
+            "Timeline (3D)", 
+            "Family overview (2D)", 
+            "Map"
             ], index=None)
         if views_sb is not None:
+            # Files with several disconnected trees can be reduced to the largest ones
+            components = store.get(st.session_state['new_file_hash'], "components")
+            if components is None:
+                components = store.put(st.session_state['new_file_hash'], "components", find_components(nodes, edges), session_id)
+            shown_nodes, shown_edges = nodes, edges
+            if len(components) > 1:
+                top_k = views.number_input(label=f"Show the largest trees (of {len(components)} disconnected trees)", min_value=1, max_value=len(components), value=len(components))
+                if top_k < len(components):
+                    shown = set().union(*components[:top_k])
+                    shown_nodes = [node for node in nodes if node in shown]
+                    shown_edges = [edge for edge in edges if edge[0] in shown]
+
             #st.sidebar.header("Select an Individual")
-            nodes_sorted = sorted(nodes)  # Sort nodes alphabetically
+            search_index = store.get(st.session_state['new_file_hash'], "search_index")
+            if search_index is None:
+                places = {node: tree['people'][tree['reverse_translator'][node]]['birth_place'] for node in nodes}
+                search_index = store.put(st.session_state['new_file_hash'], "search_index", SearchIndex(nodes, places), session_id)
             
             formating = st.sidebar.expander(label=r"$\textbf{\textsf{\normalsize Colors and highlight}}$", expanded=True)
 
@@ -638,24 +2725,17 @@ if uploaded_file is not None:
             
             root_sel = formating.checkbox(label="I want to select a root", value=True)
             if root_sel:
-                default_index = next((i for i, node in enumerate(nodes_sorted) if re.search(r"\(I0*1\)", node)), 0)
-
-                selected_individual = formating.selectbox(
-                "Select an Individual as root",
-                nodes_sorted,
-                index=default_index
-                )
+                # Only the best matches of the search are sent to the browser, not the whole list of individuals
+                default_root = search_index.ids.get("I1", (search_index.nodes or [None])[0])
+                selected_individual = select_individual(formating, "Select an Individual as root", search_index, "root_individual", default_root)
 
                 selected_root_color = formating.color_picker("Select color", default_root_color, key="selected_root_color")
                 
                 highlight_another_individual = formating.checkbox("Highlight another individual")
 
                 if highlight_another_individual:
-                    highlight_individual = formating.selectbox(
-                        "Highlight individual",
-                        [node for node in nodes_sorted if node != selected_individual],
-                        index = next((i for i, node in enumerate([node for node in nodes_sorted if node != selected_individual]) if re.search(r"\(I0*2\)", node)), 0) if selected_individual == nodes_sorted[default_index] else default_index-1
-                        )
+                    highlight_individual = select_individual(formating, "Highlight individual", search_index, "highlight_individual", 
+                        search_index.ids.get("I2") if selected_individual == default_root else None, exclude=selected_individual)
                     selected_highlight_color = formating.color_picker("Select color", default_highlight_color, key="selected_highlight_color")
                 
                 else:
@@ -663,11 +2743,23 @@ if uploaded_file is not None:
 
                 formating.markdown("""<hr style='margin-top:0em; margin-bottom:1em; border-width: 3px' /> """, unsafe_allow_html=True)
 
+                formating.markdown("**Relationship to the root**")
+
+                # Computed in one traversal of the tree, and kept per root
+                relationship = formating.selectbox(label="Color by relationship to the root", options=["None", "Kinship degree", "Connections"], index=0, key="relationship",
+                    help="Individuals are colored from the root's color (closest) towards the individuals' color (farthest). Kinship degree: generations up to "
+                         "the nearest common ancestor plus generations down from it (parents 1, siblings 2, first cousins 4), blood relatives only. "
+                         "Connections: number of couple and parent-child links from the root.")
+                distances = relationship_distances(store, st.session_state['new_file_hash'], session_id, tree, relationship, selected_individual) if relationship != "None" else None
+
+                formating.markdown("""<hr style='margin-top:0em; margin-bottom:1em; border-width: 3px' /> """, unsafe_allow_html=True)
+
                 formating.markdown("**Ancestors**")
 
-                ancestors_sel = formating.checkbox(label="I want to highlight the root's direct ancestors", value=True)
-                if ancestors_sel:
-                    ancestors = get_ancestors(parser, translator, selected_individual)    
+                ancestors_sel = formating.checkbox(label="I want to highlight the root's direct ancestors", value=True, disabled=distances is not None,
+                    help="Ancestors are part of the relationship color scale." if distances is not None else None)
+                if ancestors_sel and distances is None:
+                    ancestors = get_ancestors(parents, selected_individual)    
                     selected_ancestor_color = formating.color_picker("Select color", default_ancestor_color)
                 else:
                     st.empty()
@@ -676,9 +2768,65 @@ if uploaded_file is not None:
             else:
                 st.empty()
                 selected_individual = None
+                distances = None
+
+            if selected_individual is not None:
+                # Linear in the number of ancestors and parent links, even for dozens of generations of dynastic files
+                with st.expander(f"📊 Pedigree statistics of {selected_individual}"):
+                    pedigree = compute_pedigree(parents, selected_individual)
+                    tree_size = next((len(component) for component in components if selected_individual in component), 1)
+                    columns = st.columns(5)
+                    columns[0].metric("Distinct ancestors", f"{pedigree['ancestors']:,}")
+                    columns[1].metric("Pedigree collapse", f"{pedigree['implex']:.1f}%", help="Share of the known ancestral lines that lead to an ancestor already reached by another line (implex).")
+                    columns[2].metric("Generations", pedigree['depth'])
+                    columns[3].metric("Descendants", f"{len(get_descendants(parents, selected_individual)):,}")
+                    columns[4].metric("Tree size", f"{tree_size:,}", f"{len(components)} trees in the file" if len(components) > 1 else None, delta_color="off")
+                    if pedigree['generations']:
+                        # Markdown table: drawn on every rerun while a root is selected, without going through Arrow
+                        st.markdown("| generation | theoretical | known lines | distinct ancestors | collapse % |\n|---:|---:|---:|---:|---:|\n" + "\n".join(
+                            f"| {generation} | {theoretical:,} | {lines:,} | {distinct:,} | {100 * (1 - distinct / lines):.1f} |"
+                            for generation, theoretical, lines, distinct in pedigree['generations']))
+                    if pedigree['loops']:
+                        st.warning(f"{pedigree['loops']} ancestors are their own ancestors in the file and were left out.")
 
             button_generate_network = st.sidebar.button("Generate Network", use_container_width=True, key="generate_network_button")
 
+            # Static images drawn on the server, several views and formats at once (zipped)
+            export = st.sidebar.expander(label=r"$\textbf{\textsf{\normalsize Export images}}$")
+            export_views = export.multiselect("Views", ["Classic (2D)", "3D", "Timeline (2D)", "Timeline (3D)"], default=[views_sb] if views_sb in ["Classic (2D)", "3D", "Timeline (2D)", "Timeline (3D)"] else [])
+            export_formats = export.multiselect("Formats", ["png", "svg", "pdf"], default=["png"])
+            export_width = export.number_input("Width (pixels)", min_value=500, max_value=EXPORT_MAX_PIXELS, value=4000, step=500)
+            export_height = export.number_input("Height (pixels)", min_value=500, max_value=EXPORT_MAX_PIXELS, value=4000, step=500)
+            export_labels = export.checkbox("Names", value=True)
+            export.caption(f"PNG images larger than {EXPORT_TILE_PIXELS} pixels are split into tiles. Classic (2D) is exported from the 3D layout projected on a plane.")
+            if export.button("Prepare files", use_container_width=True, disabled=not (export_views and export_formats)):
+                color_args = {}
+                if selected_individual is not None:
+                    color_args = {'individual': selected_individual, 'individual_color': selected_root_color, 'distances': distances}
+                    if ancestors is not None:
+                        color_args.update(ancestors=ancestors, ancestors_color=selected_ancestor_color)
+                    if highlight_individual is not None:
+                        color_args.update(highlight_individual=highlight_individual, highlight_individual_color=selected_highlight_color)
+                export_colors = color_nodes(nodes, selected_base_node_color, **color_args)
+
+                # Images go straight into a zip archive on disk as they are drawn, only the finished archive is read back
+                files = []
+                with tempfile.TemporaryFile() as archive:
+                    with st.spinner("Drawing images"), zipfile.ZipFile(archive, "w") as zip_file:
+                        for view in export_views:
+                            pos2d, depth = export_layout(store, st.session_state['new_file_hash'], session_id, tree, view)
+                            name = re.sub(r"[^a-z0-9]+", "_", view.lower()).strip("_")
+                            for file_format in export_formats:
+                                files += export_image(zip_file, name, pos2d, shown_nodes, shown_edges, labels, export_colors, selected_bg_color, 
+                                    file_format, export_width, export_height, export_labels, depth)
+
+                    if len(files) == 1:
+                        with zipfile.ZipFile(archive) as zip_file:
+                            export.download_button("Download", zip_file.read(files[0]), file_name=files[0], use_container_width=True)
+                    else:
+                        archive.seek(0)
+                        export.download_button(f"Download ({len(files)} files)", archive.read(), file_name="astraview_images.zip", use_container_width=True)
+
     except ValueError as e:
         st.error(f'**Error:** {str(e)}')
         st.stop()
@@ -701,7 +2849,8 @@ if button_generate_network:
         if selected_individual is not None:
             args = {
                 'individual': selected_individual,
-                'individual_color': selected_root_color
+                'individual_color': selected_root_color,
+                'distances': distances
             }
             
             if ancestors is not None:
@@ -725,33 +2874,104 @@ if button_generate_network:
         else:
             node_color = color_nodes(nodes, selected_base_node_color)
 
+        node_color = {node: node_color[node] for node in shown_nodes}
+        network_size = (len(shown_nodes), len(shown_edges)) # nodes and connections drawn, for the 2D rendering profile
+
         if views_sb == "Classic (2D)":
-            network = create_network(
-                nodes, labels, node_color, edges, selected_bg_color, selected_individual
+            # Start from the latest computed layout of this file (3D projected on a plane), recentered on the root
+            pos2d = store.get(st.session_state['new_file_hash'], "pos2d")
+            if pos2d is None and store.get(st.session_state['new_file_hash'], "pos3d") is not None:
+                pos2d = store.put(st.session_state['new_file_hash'], "pos2d", project_to_2d(store.get(st.session_state['new_file_hash'], "pos3d")), session_id)
+            if pos2d is not None:
+                pos2d = recenter(pos2d, selected_individual)
+
+            network_html = create_network(
+                shown_nodes, labels, node_color, shown_edges, selected_bg_color, selected_individual, pos2d
             )
 
-            # By default the network is embeded within a html page with a white background and has a 1 pixel odd border, these alterations brute-force fix this. 
-            with open("gedcom.html", "r") as file:
-                network_html = file.read()
+        if views_sb == "Timeline (2D)":
+            # Birth year from left to right, families from top to bottom, no physics
+            timeline = store.get(st.session_state['new_file_hash'], "timeline")
+            if timeline is None:
+                timeline = store.put(st.session_state['new_file_hash'], "timeline", compute_timeline_layout(tree, nodes, parents), session_id)
+            pos2d = {node: (year * TIMELINE_YEAR_WIDTH / 1000, order * TIMELINE_ROW_HEIGHT / 1000) for node, (year, order, generation) in timeline.items()}
 
-                # Perform replacements using regex
-                network_html = re.sub(r'<body>', '<body style="background-color: {}">'.format(selected_bg_color), network_html)
-                network_html = re.sub(r'<div class="card" style="width: 100%">', '<div class="card" style="width: 100%; border: none !important;">', network_html)
-                network_html = re.sub(r'border: 1px solid lightgray;', 'border: 1px solid {};'.format(selected_bg_color), network_html)
+            network_html = create_network(
+                shown_nodes, labels, node_color, shown_edges, selected_bg_color, selected_individual, pos2d, physics=False
+            )
 
-            # Display the network HTML
-            with open("gedcom.html", "w") as file:
-                file.write(network_html)
+        if views_sb == "Family overview (2D)":
+            # Families as hub nodes, branches other than the root's collapsed into super-nodes (opened by clicking them)
+            overview = store.get(st.session_state['new_file_hash'], "overview")
+            if overview is None:
+                overview = store.put(st.session_state['new_file_hash'], "overview", compute_family_overview(tree, nodes), session_id)
+            shown = set(shown_nodes)
+            hub_edges = [edge for edge in overview['edges'] if edge[0] in shown]
+            hubs = set(overview['hubs']).intersection(node for edge in hub_edges for node in edge)
+            clusters = []
+            for branch, label in zip(overview['branches'], overview['labels']):
+                members = [node for node in branch if node in shown or node in hubs]
+                if selected_individual not in branch and sum(node in shown for node in members) >= FAMILY_CLUSTER_MIN:
+                    clusters.append((members, label))
+
+            network_html = create_network(
+                shown_nodes + sorted(hubs), {**labels, **{hub: "" for hub in hubs}}, {**node_color, **{hub: selected_base_node_color for hub in hubs}},
+                hub_edges, selected_bg_color, selected_individual, hubs=hubs, clusters=clusters
+            )
+            network_size = (len(shown_nodes) + len(hubs), len(hub_edges))
+            st.caption(f"{len(shown_nodes)} individuals in {len(hubs)} families: {len(hub_edges)} connections instead of {len(shown_edges)}. "
+                       f"{len(clusters)} branches are collapsed, click one to open it.")
 
-            with open("gedcom.html", "r") as file:
-                network_html = file.read()
+        if views_sb in ["Classic (2D)", "Timeline (2D)", "Family overview (2D)"]:
+            # By default the network is embeded within a html page with a white background and has a 1 pixel odd border, these alterations brute-force fix this. 
+            # Perform replacements using regex
+            network_html = re.sub(r'<body>', '<body style="background-color: {}">'.format(selected_bg_color), network_html)
+            network_html = re.sub(r'<div class="card" style="width: 100%">', '<div class="card" style="width: 100%; border: none !important;">', network_html)
+            network_html = re.sub(r'border: 1px solid lightgray;', 'border: 1px solid {};'.format(selected_bg_color), network_html)
 
+            # Display the network HTML
+            store.record_payload(views_sb, len(network_html.encode()))
             st.components.v1.html(network_html, height=800)
+            if not network_profile(*network_size)['labels']:
+                st.caption("Large network: names are shown when zooming in, or when hovering over an individual.")
+
+        if views_sb == "Timeline (3D)":
+            # Birth year, family order and generation on the three axes, scaled to the same range; one step per individual
+            # at least, so neighbors in family order stay apart once quantized (see plot_3d_network)
+            timeline = store.get(st.session_state['new_file_hash'], "timeline")
+            if timeline is None:
+                timeline = store.put(st.session_state['new_file_hash'], "timeline", compute_timeline_layout(tree, nodes, parents), session_id)
+            coordinates = np.array(list(timeline.values()), dtype=float)
+            coordinates = (coordinates - coordinates.min(axis=0)) / np.maximum(np.ptp(coordinates, axis=0), 1)
+            pos3d = dict(zip(timeline.keys(), coordinates))
+            # The root's neighborhood is sent first, then figures with more individuals replace it, up to the whole network
+            chart, batches = st.empty(), progressive_batches(shown_nodes, shown_edges, selected_individual)
+            for batch_nodes, batch_edges in batches:
+                fig = plot_3d_network(batch_nodes, batch_edges, labels, node_color, selected_bg_color, pos3d, selected_individual,
+                                      extent=shown_nodes, steps=max(PAYLOAD_STEPS, len(timeline)))
+                chart.plotly_chart(fig, use_container_width=True, height=800, config={'modeBarButtonsToRemove': ['toImage']})
+            store.record_payload(views_sb, progressive_payload(fig, batches))
 
         if views_sb == "3D":
             # Plot the 3D network
-            fig = plot_3d_network(nodes, edges, labels, node_color, selected_bg_color)
-            st.plotly_chart(fig, use_container_width=True, height=800, config={'modeBarButtonsToRemove': ['toImage']})
+            pos3d = layout_3d(store, st.session_state['new_file_hash'], session_id, tree)
+            # The root's neighborhood is sent first, then figures with more individuals replace it, up to the whole network
+            chart, batches = st.empty(), progressive_batches(shown_nodes, shown_edges, selected_individual)
+            for batch_nodes, batch_edges in batches:
+                fig = plot_3d_network(batch_nodes, batch_edges, labels, node_color, selected_bg_color, pos3d, selected_individual, extent=shown_nodes)
+                chart.plotly_chart(fig, use_container_width=True, height=800, config={'modeBarButtonsToRemove': ['toImage']})
+            store.record_payload(views_sb, progressive_payload(fig, batches))
+
+        if views_sb == "Map":
+            # Birth places are geocoded offline, once per file
+            places = {node: tree['people'][tree['reverse_translator'][node]]['birth_place'] for node in nodes}
+            coordinates = store.get(st.session_state['new_file_hash'], "coordinates")
+            if coordinates is None:
+                coordinates = store.put(st.session_state['new_file_hash'], "coordinates", get_gazetteer().geocode(list(places.values())), session_id)
+            fig, placed = plot_map(shown_nodes, labels, node_color, selected_bg_color, places, coordinates)
+            store.record_payload(views_sb, len(fig.to_json().encode()))
+            st.plotly_chart(fig, use_container_width=True, height=800)
+            st.caption(f"{placed} of {len(shown_nodes)} individuals placed by place of birth. Places not found in the offline gazetteer are left out.")
 
 st.sidebar.markdown(""" **Author:** [João L. Neto](https://github.com/jlnetosci)""", unsafe_allow_html=True)
 
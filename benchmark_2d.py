@@ -0,0 +1,180 @@
+"""
+Benchmark of the 2D network in the browser: time to the first drawing and to a stable layout, per rendering profile.
+
+The 2D view is drawn by vis.js in the browser, so the server-side latency (see loadtest.py) does not show how long the page takes to
+settle. This script generates the 2D page of files from gedcom_files/ and runs it with node and the vis-network build bundled with pyvis,
+against a do-nothing DOM (no browser needed, nothing leaves the machine): layout, physics and label measurement run as in the browser,
+drawing calls go to an empty canvas, and animation frames are spaced as at 60 fps.
+
+Each file is run with the vis.js defaults used before the size-adaptive profiles ("default", the small profile for every size) and with the
+profile chosen by network_profile ("adaptive"), starting from circles (a newly uploaded file) and optionally from a computed layout.
+
+usage:
+    python benchmark_2d.py                                   # the large bundled files
+    python benchmark_2d.py --file Royal92.ged --start cold warm
+    python benchmark_2d.py --json results.json              # also save the results
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from devtools import find_gedcom, load_app, print_table
+
+## Default files: the largest bundled trees
+FILES = ["BibleFamilyTree.ged", "AmericanPresidents.ged", "Royal92.ged"]
+
+RUN_TIMEOUT = 600 # seconds before a page is counted as not settling
+FRAME_MS = 16 # animation frames at 60 fps
+
+# Minimal DOM for vis-network: every unknown property is a callable stub, sizes are 800 pixels, text is 6 pixels per character.
+# Reports the first drawing, and the time when every node is added and the physics has stopped (stabilized, or turned off).
+HARNESS = r"""
+const fs = require('fs');
+const NULLS = new Set(['parentNode', 'parentElement', 'offsetParent', 'nextSibling', 'previousSibling', 'firstChild', 'lastChild', 'ownerDocument']);
+const SIZES = new Set(['width', 'height', 'clientWidth', 'clientHeight', 'offsetWidth', 'offsetHeight']);
+function stub() {
+  return new Proxy(function () { return stub(); }, {
+    get(target, key) {
+      if (key === Symbol.toPrimitive) return () => 0;
+      if (typeof key === 'symbol' || key === 'then' || key === 'toJSON') return undefined;
+      if (key in target) return target[key];
+      if (NULLS.has(key)) return null;
+      if (SIZES.has(key)) return 800;
+      if (key === 'length' || key === 'nodeType') return 0;
+      if (key === 'hasChildNodes' || key === 'contains' || key === 'hasAttribute') return () => false;
+      if (key === 'measureText') return (text) => ({width: 6 * String(text).length});
+      if (key === 'getBoundingClientRect') return () => ({left: 0, top: 0, right: 800, bottom: 800, width: 800, height: 800});
+      return target[key] = stub();
+    },
+    set(target, key, value) { target[key] = value; return true; },
+    construct() { return stub(); },
+  });
+}
+global.window = global;
+global.document = stub();
+global.navigator = {userAgent: 'node', language: 'en', languages: ['en']};
+global.devicePixelRatio = 1;
+global.Element = function () {};
+global.HTMLElement = function () {};
+global.addEventListener = () => {};
+global.removeEventListener = () => {};
+global.getComputedStyle = () => stub();
+global.requestAnimationFrame = (callback) => setTimeout(() => callback(Date.now()), FRAME_MS);
+global.cancelAnimationFrame = clearTimeout;
+(function () { var module = undefined, exports = undefined, define = undefined; eval(fs.readFileSync(process.argv[2], 'utf8')); global.vis = vis; })();
+
+var nodes, edges, network, nodeColors, allNodes, allEdges, data;
+eval(fs.readFileSync(process.argv[3], 'utf8').replace('drawGraph();', ''));
+const total = Number(process.argv[4]);
+const start = Date.now();
+network = drawGraph();
+const result = {construct: Date.now() - start, first_drawing: null, iterations: 0, stable: null};
+network.on('afterDrawing', () => { if (result.first_drawing === null) result.first_drawing = Date.now() - start; });
+network.on('stabilizationIterationsDone', () => { result.iterations += network.physics.stabilizationIterations; });
+setInterval(() => {
+  const physics = network.physics;
+  if (nodes.length == total && physics.stabilized && physics.viewFunction === undefined && result.first_drawing !== null) {
+    result.stable = Date.now() - start;
+    result.physics = physics.physicsEnabled && physics.options.enabled;
+    console.log(JSON.stringify(result));
+    process.exit(0);
+  }
+}, 5);
+"""
+
+def vis_library():
+    """
+    Path of the vis-network build bundled with pyvis (the one inlined in the 2D page).
+    """
+    import pyvis
+    library = os.path.join(os.path.dirname(pyvis.__file__), "templates", "lib", "vis-9.1.2", "vis-network.min.js")
+    if not os.path.exists(library):
+        raise FileNotFoundError(f"vis-network is not bundled with this version of pyvis ({library})")
+    return library
+
+def run_page(app, tree, pos2d, profile, harness, library):
+    """
+    Generates the 2D page of :tree: with :profile: (None for the adaptive one) and runs it with node.
+
+    return:
+    :result: dictionary with the times (ms) to construct the network, to the first drawing and to a stable layout, and the stabilization iterations.
+    """
+    nodes = tree['nodes']
+    html = app['create_network'](nodes, tree['labels'], dict.fromkeys(nodes, "#ffffff"), tree['edges'], "#222222", nodes[0], pos2d, profile=profile)
+    script = re.search(r"(function drawGraph\(\) \{.*?\n\s*drawGraph\(\);)", html, re.S).group(1)
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False, encoding="utf-8") as file:
+        file.write(script)
+    try:
+        output = subprocess.run(["node", harness, library, file.name, str(len(nodes))], capture_output=True, text=True, timeout=RUN_TIMEOUT).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    except (subprocess.TimeoutExpired, IndexError, ValueError):
+        return {"construct": None, "first_drawing": None, "iterations": None, "stable": None}
+    finally:
+        os.remove(file.name)
+
+def run_file(app, path, starts, harness, library):
+    with open(path, 'rb') as file:
+        data = file.read()
+    tree = app['process_gedcom'](app['read_gedcom'](app['io'].BytesIO(data)))
+    nodes, edges = tree['nodes'], tree['edges']
+    results = []
+    if not edges:
+        print(f"{os.path.basename(path)}: skipped, no connections to draw", flush=True)
+        return results
+    for start in starts:
+        pos2d = None
+        if start == "warm":
+            # Computed layout of the file, as the Classic (2D) view gets it from the build step or the 3D view
+            precomputed = app['load_precomputed'](app['hashlib'].sha256(data).hexdigest())
+            pos2d = precomputed['pos2d'] if precomputed else app['project_to_2d'](app['compute_3d_layout'](edges, nodes))
+            pos2d = app['recenter'](pos2d, nodes[0])
+        for name, profile in [("default", app['network_profile'](0, 0)), ("adaptive", None)]:
+            result = run_page(app, tree, pos2d, profile, harness, library)
+            results.append({
+                "file": os.path.basename(path),
+                "nodes": len(nodes),
+                "edges": len(edges),
+                "start": start,
+                "profile": name if profile else f"adaptive ({app['network_profile'](len(nodes), len(edges))['name']})",
+                "first drawing (ms)": result["first_drawing"],
+                "stable (ms)": result["stable"],
+                "stabilization iterations": result["iterations"],
+            })
+            print(f"{results[-1]['file']} / {start} / {results[-1]['profile']}: " + (f"first drawing {result['first_drawing']} ms, stable {result['stable']} ms, "
+                  f"{result['iterations']} stabilization iterations" if result['stable'] is not None else f"not stable after {RUN_TIMEOUT} s"), flush=True)
+    return results
+
+COLUMNS = ["file", "nodes", "edges", "start", "profile", "first drawing (ms)", "stable (ms)", "stabilization iterations"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Client-side benchmark of the 2D network (vis.js in node, no browser needed).")
+    parser.add_argument("--file", nargs="+", default=FILES, help="GEDCOM files of the corpus (names or paths)")
+    parser.add_argument("--start", nargs="+", choices=["cold", "warm"], default=["cold"], help="start from circles (cold) or from a computed layout (warm)")
+    parser.add_argument("--json", help="also save the results to this file")
+    args = parser.parse_args()
+
+    if shutil.which("node") is None:
+        sys.exit("node is needed to run vis.js outside of the browser")
+    app = load_app()
+    library = vis_library()
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False, encoding="utf-8") as file:
+        file.write(HARNESS.replace("FRAME_MS", str(FRAME_MS)))
+    try:
+        results = [result for name in args.file for result in run_file(app, find_gedcom(name), args.start, file.name, library)]
+    finally:
+        os.remove(file.name)
+
+    print()
+    print_table(results, COLUMNS, lambda column, value: str(value) if value is not None else f"> {RUN_TIMEOUT} s")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Check of the incremental processing of re-uploaded files: processing an edited file against the tree of the previous version
+(process_gedcom(lines, previous)) must give the same tree as processing it from scratch.
+
+Edits are made to files from gedcom_files/: each FAM record removed, then put back; an INDI record removed, then put back;
+and a name changed. Both directions are checked (original to edited and edited to original).
+
+usage:
+    python check_incremental.py                              # the default files
+    python check_incremental.py --file Royal92.ged --edits 50
+"""
+
+import sys
+import argparse
+
+from devtools import find_gedcom, load_app
+
+## Default files: a small and a medium file
+FILES = ["TolkienFamily.ged", "ASOIAF.ged"]
+EDITS = 30 # records of each type edited per file (spread over the file)
+
+def canonical(tree):
+    """
+    What the views use of a tree, independent of the order in which records were processed.
+    """
+    return {
+        'nodes': sorted(tree['nodes']),
+        'edges': sorted(tuple(sorted(edge)) for edge in tree['edges']),
+        'labels': tree['labels'],
+        'translator': tree['translator'],
+        'people': tree['people'],
+        'parents': {node: sorted(parents) for node, parents in tree['parents'].items()},
+        'fams': {key: sorted(members) for key, members in tree['fams'].items() if members},
+        'famc': {key: sorted(members) for key, members in tree['famc'].items() if members},
+    }
+
+def edits(lines, records, count):
+    """
+    Edited versions of the file: (description, lines) for :count: FAM records removed, :count: INDI records removed and :count: names changed.
+    """
+    for tag in ["FAM", "INDI"]:
+        pointers = [pointer for pointer, record in records.items() if record[0] == tag]
+        for pointer in pointers[::max(1, len(pointers) // count)][:count]:
+            _, _, start, end = records[pointer]
+            yield f"{tag} {pointer} removed", lines[:start] + lines[end:]
+    pointers = [pointer for pointer, record in records.items() if record[0] == "INDI"]
+    for pointer in pointers[::max(1, len(pointers) // count)][:count]:
+        _, _, start, end = records[pointer]
+        renamed = [line.replace(" NAME ", " NAME Edited ", 1) if line.startswith("1 NAME ") else line for line in lines[start:end]]
+        yield f"INDI {pointer} renamed", lines[:start] + renamed + lines[end:]
+
+def check_file(app, path, count):
+    """
+    return:
+    :failures: list of (edit, direction, keys of the tree that differ).
+    """
+    with open(path, 'rb') as file:
+        lines = app['read_gedcom'](file)
+    original = app['process_gedcom'](lines)
+    failures = []
+    for description, edited in edits(lines, app['split_records'](lines), count):
+        full = app['process_gedcom'](edited)
+        for direction, (previous, current, expected) in {"to edited": (original, edited, full), "back to original": (full, lines, original)}.items():
+            result, reference = canonical(app['process_gedcom'](current, previous)), canonical(expected)
+            different = [key for key in reference if result[key] != reference[key]]
+            if different:
+                failures.append((description, direction, different))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that incremental processing of edited files gives the same tree as a full parse.")
+    parser.add_argument("--file", nargs="+", default=FILES, help="GEDCOM files of the corpus (names or paths)")
+    parser.add_argument("--edits", type=int, default=EDITS, help="records of each type edited per file")
+    args = parser.parse_args()
+
+    app = load_app()
+    failed = False
+    for name in args.file:
+        failures = check_file(app, find_gedcom(name), args.edits)
+        print(f"{name}: " + (f"{len(failures)} edits differ from a full parse" if failures else "incremental processing matches a full parse"), flush=True)
+        for description, direction, different in failures[:10]:
+            print(f"    {description}, {direction}: {', '.join(different)} differ")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
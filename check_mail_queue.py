@@ -0,0 +1,165 @@
+"""
+Check of the mail queue of the contact form (pages/contact-form.py) against a local SMTP stand-in (aiosmtpd, on 127.0.0.1: 
+nothing leaves the machine). Each check uses its own queue folder:
+
+    delivery    queued messages are delivered, with login, and removed from the queue
+    retry       with the server down, messages stay queued (whole, with their attempts counted) and are sent once it is up
+    restart     messages already on disk when the queue starts are sent without a new submission
+    unreadable  broken message files are moved to failed/ and the worker keeps sending the others (the error is logged)
+    page        loading the contact page starts the worker (messages queued before a restart are sent)
+
+Retries are shortened (RETRY_BACKOFF seconds instead of MAIL_BACKOFF).
+
+usage:
+    pip install aiosmtpd
+    python check_mail_queue.py
+    python check_mail_queue.py --check retry restart
+"""
+
+import os
+import sys
+import json
+import time
+import email
+import socket
+import argparse
+import logging
+import tempfile
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+from devtools import BASE_DIR, load_app
+
+CHECKS = ["delivery", "retry", "restart", "unreadable", "page"]
+RETRY_BACKOFF = 0.2 # seconds before the first retry
+TIMEOUT = 30 # seconds a check waits for the messages to arrive
+
+class Inbox:
+    """
+    SMTP stand-in handler: keeps the recipients and subject of every message received.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], email.message_from_bytes(envelope.content)['Subject']))
+        return "250 OK"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(inbox, port):
+    controller = Controller(inbox, hostname="127.0.0.1", port=port, auth_require_tls=False, authenticator=lambda *args: AuthResult(success=True))
+    controller.start()
+    return controller
+
+def wait_for(condition, timeout=TIMEOUT):
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+def queued(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+
+def write_message(directory, name, subject):
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+        json.dump({'to': "someone@example.com", 'subject': subject, 'body': "Hello", 'attempts': 0, 'next_attempt': 0}, file)
+
+def check_delivery(page, directory, port):
+    inbox = Inbox()
+    server = start_server(inbox, port)
+    try:
+        queue = page['MailQueue'](directory, "127.0.0.1", port, "user", "secret", tls=False)
+        for i in range(3):
+            queue.put("someone@example.com", f"message {i}", "Hello")
+        if not wait_for(lambda: len(inbox.messages) == 3 and not queued(directory)):
+            return f"{len(inbox.messages)} of 3 messages received, {len(queued(directory))} left in the queue"
+        if [subject for _, subject in inbox.messages] != ["message 0", "message 1", "message 2"]:
+            return f"received out of order: {inbox.messages}"
+    finally:
+        server.stop()
+
+def check_retry(page, directory, port):
+    queue = page['MailQueue'](directory, "127.0.0.1", port, "user", "secret", tls=False)
+    queue.put("someone@example.com", "while down", "Hello")
+    if not wait_for(lambda: queued(directory) and json.load(open(os.path.join(directory, queued(directory)[0])))['attempts'] >= 2):
+        return "the message was not retried while the server was down"
+    inbox = Inbox()
+    server = start_server(inbox, port)
+    try:
+        if not wait_for(lambda: inbox.messages and not queued(directory)):
+            return "the message was not sent once the server was up"
+    finally:
+        server.stop()
+
+def check_restart(page, directory, port):
+    for i in range(2):
+        write_message(directory, f"{i}-left.json", f"left {i}")
+    inbox = Inbox()
+    server = start_server(inbox, port)
+    try:
+        page['MailQueue'](directory, "127.0.0.1", port, "user", "secret", tls=False)
+        if not wait_for(lambda: len(inbox.messages) == 2 and not queued(directory)):
+            return f"{len(inbox.messages)} of 2 messages left on disk were sent"
+    finally:
+        server.stop()
+
+def check_unreadable(page, directory, port):
+    with open(os.path.join(directory, "0-truncated.json"), 'w', encoding='utf-8') as file:
+        file.write('{"to": "someone@exa')
+    with open(os.path.join(directory, "1-fields.json"), 'w', encoding='utf-8') as file:
+        json.dump({'to': "someone@example.com"}, file)
+    write_message(directory, "2-valid.json", "valid")
+    inbox = Inbox()
+    server = start_server(inbox, port)
+    try:
+        page['MailQueue'](directory, "127.0.0.1", port, "user", "secret", tls=False)
+        if not wait_for(lambda: inbox.messages and not queued(directory)):
+            return "the valid message was not sent"
+        failed = sorted(os.listdir(os.path.join(directory, 'failed')))
+        if failed != ["0-truncated.json", "1-fields.json"]:
+            return f"failed/ holds {failed}"
+    finally:
+        server.stop()
+
+def check_page(page, directory, port):
+    from streamlit.testing.v1 import AppTest
+    write_message(directory, "0-left.json", "left before a restart")
+    inbox = Inbox()
+    server = start_server(inbox, port)
+    try:
+        os.environ.update({"MAIL_QUEUE": directory, "PORT": str(port)})
+        AppTest.from_file(os.path.join(BASE_DIR, "pages", "contact-form.py"), default_timeout=60).run()
+        if not wait_for(lambda: inbox.messages and not queued(directory)):
+            return "loading the page did not send the queued message"
+    finally:
+        server.stop()
+
+def main():
+    logging.getLogger("mail.log").setLevel(logging.ERROR) # aiosmtpd warns about its own deprecated login data on every login
+    parser = argparse.ArgumentParser(description="Checks the mail queue of the contact form against a local SMTP stand-in.")
+    parser.add_argument("--check", nargs="+", default=CHECKS, choices=CHECKS, help="checks to run")
+    args = parser.parse_args()
+
+    # Settings the contact page reads when it loads (a local server without STARTTLS)
+    for name, value in {"OPTIONS": "ABCDEF", "SERVER": "127.0.0.1", "PORT": "25", "U": "user", "SECRET": "secret", "RECIPIENT": "owner@example.com", "SMTP_TLS": "0"}.items():
+        os.environ.setdefault(name, value)
+    page = load_app(os.path.join("pages", "contact-form.py"), "## Start the mail worker")
+    page['MAIL_BACKOFF'] = RETRY_BACKOFF
+
+    failed = False
+    for check in args.check:
+        with tempfile.TemporaryDirectory() as directory:
+            failure = globals()[f"check_{check}"](page, directory, free_port())
+        print(f"{check}: " + (f"FAILED, {failure}" if failure else "ok"), flush=True)
+        failed = failed or bool(failure)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Helpers shared by the development scripts (loadtest.py, benchmark_2d.py, check_incremental.py and check_mail_queue.py): 
+finding files of the bundled corpus, loading the app's functions without running the app, and printing result tables.
+"""
+
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEDCOM_DIR = os.path.join(BASE_DIR, 'gedcom_files')
+
+def find_gedcom(name):
+    """
+    Finds a file of the bundled corpus by name (e.g. "Royal92.ged"), or returns the path as given if it exists.
+    """
+    if os.path.exists(name):
+        return name
+    for directory, _, files in os.walk(GEDCOM_DIR):
+        if name in files:
+            return os.path.join(directory, name)
+    raise FileNotFoundError(f"{name} is not in {GEDCOM_DIR}")
+
+def load_app(script="app.py", end="#### Streamlit app ####"):
+    """
+    Definitions of the app (everything before its Streamlit section), without running the app.
+
+    input:
+    :script: path of the script, relative to the repository (e.g. "pages/contact-form.py").
+    :end: line that starts the part of the script that runs the page.
+
+    return:
+    :namespace: dictionary of name to function, class or constant of :script:.
+    """
+    path = os.path.join(BASE_DIR, script)
+    with open(path, encoding="utf-8") as file:
+        source = file.read().split(end)[0]
+    namespace = {"__name__": "astraviewer", "__file__": path}
+    from streamlit import config
+    config.set_option("global.showWarningOnDirectExecution", False) # no warning about running without `streamlit run`
+    exec(compile(source, script, "exec"), namespace)
+    return namespace
+
+def print_table(results, columns, format_value=None):
+    """
+    Prints the :columns: of :results: (list of dictionaries) as an aligned table, each value formatted with :format_value:.
+    """
+    format_value = format_value or (lambda column, value: str(value))
+    rows = [[format_value(column, result[column]) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,334 @@
+"""
+Load test for ASTRAviewer: how many concurrent sessions can one server handle.
+
+Starts the app with `streamlit run` (headless, on a local port, nothing leaves the machine) and drives concurrent sessions through
+the same websocket protocol as the browser: each simulated user uploads a file from gedcom_files/, picks a view, searches and changes
+the root individual, changes the color palette and generates the view. Every step is a rerun of the script; the time from sending
+the widget values to the end of the rerun is its latency.
+
+Each scenario (file, view, number of users) runs on a fresh server and reports throughput, p50/p95/p99 rerun latency and the peak
+resident memory of the server (and its layout worker processes).
+
+usage:
+    python loadtest.py                                   # default scenarios with 1, 4 and 8 users
+    python loadtest.py --users 2 16 --file Royal92.ged --view 3D
+    python loadtest.py --json results.json              # also save the results
+"""
+
+import os
+import re
+import sys
+import time
+import json
+import uuid
+import random
+import socket
+import argparse
+import subprocess
+import urllib.request
+import numpy as np
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.proto.Common_pb2 import FileURLsRequest, FileUploaderState, UploadedFileInfo
+
+from devtools import BASE_DIR, find_gedcom, print_table
+
+## Default scenarios: a small, a medium and a large file
+SCENARIOS = [("TolkienFamily.ged", "Classic (2D)"), ("ASOIAF.ged", "3D"), ("Royal92.ged", "Timeline (2D)")]
+USERS = [1, 4, 8]
+
+RERUN_TIMEOUT = 600 # seconds before a rerun is counted as failed
+SERVER_START_TIMEOUT = 60 # seconds to wait for the server to answer its health check
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(port):
+    """
+    Starts the app headless on :port: and waits until it answers.
+
+    return:
+    :server: the server process.
+    """
+    server = subprocess.Popen([sys.executable, "-m", "streamlit", "run", os.path.join(BASE_DIR, "app.py"),
+        "--server.headless=true", f"--server.port={port}", "--server.address=127.0.0.1",
+        "--server.enableXsrfProtection=false", "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.time()
+    while time.time() - start < SERVER_START_TIMEOUT:
+        try:
+            if urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).read() == b"ok":
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The server did not start.")
+
+def peak_rss(pid):
+    """
+    Peak resident memory (VmHWM, Linux) of a process and its child processes, in bytes.
+    """
+    total = 0
+    pids = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/status") as file:
+                total += int(re.search(r"VmHWM:\s+(\d+)", file.read()).group(1)) * 1024
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as file:
+                    pids += [int(child) for child in file.read().split()]
+        except (OSError, AttributeError):
+            continue
+    return total
+
+class Session:
+    """
+    A simulated browser tab: keeps the widgets of the last rerun and the values set on them, and sends them like the frontend does.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = None
+        self.session_id = None
+        self.widgets = {} # (element type, label) -> list of widget protos of the last rerun, in page order
+        self.elements = set() # element types of the last rerun
+        self.states = {} # widget ID -> WidgetState sent with every rerun
+        self.cache = {} # message hash -> message, large messages are sent once and then referenced by hash
+        self.latencies = [] # (step, seconds)
+        self.errors = []
+
+    @gen.coroutine
+    def connect(self):
+        self.connection = yield websocket_connect(f"ws://127.0.0.1:{self.port}/_stcore/stream", subprotocols=["streamlit"], max_message_size=1024 ** 3)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    @gen.coroutine
+    def receive(self):
+        """
+        Next message from the server (references to cached messages resolved).
+        """
+        data = yield self.connection.read_message()
+        if data is None:
+            raise ConnectionError("The server closed the connection.")
+        msg = ForwardMsg()
+        msg.ParseFromString(data)
+        if msg.WhichOneof("type") == "ref_hash":
+            msg = self.cache[msg.ref_hash]
+        elif msg.metadata.cacheable:
+            self.cache[msg.hash] = msg
+        return msg
+
+    @gen.coroutine
+    def rerun(self, step):
+        """
+        Sends the widget values and waits for the rerun to finish, recording its latency.
+        """
+        back = BackMsg()
+        back.rerun_script.query_string = ""
+        back.rerun_script.widget_states.widgets.extend(self.states.values())
+        widgets = {}
+        elements = set()
+        start = time.perf_counter()
+        self.connection.write_message(back.SerializeToString(), binary=True)
+        while True:
+            msg = yield gen.with_timeout(time.time() + RERUN_TIMEOUT, self.receive())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                field = element.WhichOneof("type")
+                widget = getattr(element, field)
+                elements.add(field)
+                if field == "exception":
+                    self.errors.append(f"{step}: {widget.message}")
+                elif field == "alert" and widget.format == widget.ERROR:
+                    self.errors.append(f"{step}: {widget.body[:200]}")
+                elif hasattr(widget, "id") and hasattr(widget, "label"):
+                    widgets.setdefault((field, widget.label), []).append(widget)
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+        self.latencies.append((step, time.perf_counter() - start))
+        self.widgets = widgets
+        self.elements = elements
+
+        # Buttons only trigger the rerun they were clicked in
+        for widget_id in [widget_id for widget_id, state in self.states.items() if state.WhichOneof("value") == "trigger_value"]:
+            del self.states[widget_id]
+
+    def widget(self, field, label, position=0):
+        """
+        Widget proto of the last rerun by element type and label (:position: among widgets with the same label).
+        """
+        found = self.widgets.get((field, label), [])
+        if len(found) <= position:
+            raise LookupError(f"No {field} labelled {label!r} on the page.")
+        return found[position]
+
+    def set(self, widget, **value):
+        """
+        Sets the value sent for :widget: from now on, e.g. set(selectbox, int_value=2).
+        """
+        state = WidgetState(id=widget.id, **value)
+        self.states[widget.id] = state
+
+    @gen.coroutine
+    def upload(self, path):
+        """
+        Uploads a file like the file uploader does: asks for an upload URL, sends the file, then sets the widget value.
+        """
+        uploader = self.widget("file_uploader", "Upload a GEDCOM file (or several, to merge them)")
+        name = os.path.basename(path)
+        with open(path, "rb") as file:
+            data = file.read()
+
+        back = BackMsg()
+        back.file_urls_request.CopyFrom(FileURLsRequest(request_id=uuid.uuid4().hex, file_names=[name], session_id=self.session_id))
+        self.connection.write_message(back.SerializeToString(), binary=True)
+        while True:
+            msg = yield self.receive()
+            if msg.WhichOneof("type") == "file_urls_response":
+                break
+        file_urls = msg.file_urls_response.file_urls[0]
+
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+                f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        yield AsyncHTTPClient().fetch(HTTPRequest(f"http://127.0.0.1:{self.port}{file_urls.upload_url}", method="PUT", body=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}))
+
+        info = UploadedFileInfo(name=name, size=len(data), file_id=file_urls.file_id, file_urls=file_urls)
+        self.set(uploader, file_uploader_state_value=FileUploaderState(max_file_id=0, uploaded_file_info=[info]))
+
+@gen.coroutine
+def run_user(port, path, view, think, rng):
+    """
+    One user session: open, upload, pick the view, search and change the root, change the palette, generate.
+
+    return:
+    :session: the finished Session (latencies and errors).
+    """
+    session = Session(port)
+    yield session.connect()
+    try:
+        yield session.rerun("open")
+
+        yield session.upload(path)
+        yield session.rerun("upload")
+
+        views = session.widget("selectbox", "Select a view")
+        session.set(views, int_value=list(views.options).index(view))
+        yield session.rerun("view")
+
+        # Search for someone by the first word of a name, then pick one of the matches as root
+        root = session.widget("selectbox", "Select an Individual as root")
+        words = [word for option in root.options for word in option.split()[:1] if len(word) > 2]
+        yield gen.sleep(think)
+        session.set(session.widget("text_input", "Search by name, ID or place of birth"), string_value=rng.choice(words or ["a"]))
+        yield session.rerun("search")
+        root = session.widget("selectbox", "Select an Individual as root")
+        session.set(root, int_value=rng.randrange(len(root.options)) if root.options else 0)
+        yield session.rerun("root")
+
+        yield gen.sleep(think)
+        palettes = session.widget("selectbox", "Select a color palette")
+        session.set(palettes, int_value=rng.randrange(len(palettes.options)))
+        yield session.rerun("palette")
+
+        yield gen.sleep(think)
+        session.set(session.widget("button", "Generate Network"), trigger_value=True)
+        yield session.rerun("generate")
+        if not session.elements & {"plotly_chart", "iframe"}:
+            session.errors.append("generate: no view was drawn")
+
+    except Exception as e:
+        session.errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        session.close()
+    return session
+
+def run_scenario(path, view, users, think=0.0, seed=0):
+    """
+    Runs :users: concurrent sessions against a fresh server.
+
+    return:
+    :result: dictionary with throughput, latency percentiles (ms), peak RSS (MB) and errors.
+    """
+    port = free_port()
+    server = start_server(port)
+    rng = random.Random(seed)
+    try:
+        start = time.perf_counter()
+        sessions = IOLoop.current().run_sync(lambda: gen.multi([run_user(port, path, view, think, random.Random(rng.random())) for _ in range(users)]), timeout=RERUN_TIMEOUT * 10)
+        wall = time.perf_counter() - start
+        rss = peak_rss(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = np.array([seconds for session in sessions for _, seconds in session.latencies]) * 1000
+    steps = {}
+    for session in sessions:
+        for step, seconds in session.latencies:
+            steps.setdefault(step, []).append(seconds * 1000)
+    percentile = lambda values, q: round(float(np.percentile(values, q)), 1) if len(values) else None
+    return {
+        "file": os.path.basename(path),
+        "view": view,
+        "users": users,
+        "reruns": len(latencies),
+        "wall (s)": round(wall, 2),
+        "reruns/s": round(len(latencies) / wall, 2),
+        "sessions/min": round(sum(not session.errors for session in sessions) / wall * 60, 1),
+        "p50 (ms)": percentile(latencies, 50),
+        "p95 (ms)": percentile(latencies, 95),
+        "p99 (ms)": percentile(latencies, 99),
+        "peak RSS (MB)": round(rss / 1024 ** 2, 1),
+        "steps p50 (ms)": {step: percentile(values, 50) for step, values in steps.items()},
+        "errors": [error for session in sessions for error in session.errors],
+    }
+
+COLUMNS = ["file", "view", "users", "reruns", "reruns/s", "sessions/min", "p50 (ms)", "p95 (ms)", "p99 (ms)", "peak RSS (MB)", "errors"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for ASTRAviewer (runs offline against gedcom_files/).")
+    parser.add_argument("--users", type=int, nargs="+", default=USERS, help="numbers of concurrent users, one scenario each")
+    parser.add_argument("--file", help="GEDCOM file of the corpus (name or path), instead of the default scenarios")
+    parser.add_argument("--view", default="3D", help="view generated with --file")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user waits between steps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also save the results to this file")
+    args = parser.parse_args()
+
+    scenarios = [(args.file, args.view)] if args.file else SCENARIOS
+    results = []
+    for name, view in scenarios:
+        for users in args.users:
+            result = run_scenario(find_gedcom(name), view, users, args.think, args.seed)
+            results.append(result)
+            print(f"{result['file']} / {view} / {users} users: p50 {result['p50 (ms)']} ms, p95 {result['p95 (ms)']} ms, "
+                  f"{result['reruns/s']} reruns/s, {result['peak RSS (MB)']} MB" + (f", {len(result['errors'])} errors" if result['errors'] else ""), flush=True)
+            for error in result["errors"][:3]:
+                print(f"    {error}", flush=True)
+
+    print()
+    print_table(results, COLUMNS, lambda column, value: str(len(value) if column == "errors" else value))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
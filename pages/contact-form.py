@@ -16,6 +16,10 @@ import os
 import time
 import datetime
 import base64
+import json
+import uuid
+import logging
+import threading
 
 from email_validator import validate_email, EmailNotValidError
 from email.mime.text import MIMEText
@@ -62,18 +66,255 @@ port = os.environ["PORT"]
 u = os.environ["U"]
 secret = os.environ["SECRET"]
 recipient = os.environ["RECIPIENT"]
+smtp_tls = os.environ.get("SMTP_TLS", "1") != "0" # set SMTP_TLS=0 only for a local SMTP stand-in without STARTTLS
+
+## CAPTCHAs are rendered ahead of time by a background worker
+CAPTCHA_POOL_SIZE = int(os.environ.get("CAPTCHA_POOL_SIZE", 50)) # pre-rendered CAPTCHAs kept ready
+CAPTCHA_REFRESH_LIMIT = 5 # refreshes allowed per session within CAPTCHA_REFRESH_WINDOW
+CAPTCHA_REFRESH_WINDOW = 60 # seconds
+CAPTCHA_PREPARING = "Preparing a CAPTCHA… it appears as you fill in the form, or with Refresh."
+
+## Mail delivery: messages are queued on disk and sent by a background worker
+MAIL_QUEUE = os.environ.get("MAIL_QUEUE", os.path.join(BASE_DIR, '.cache', 'mail'))
+MAIL_RETRIES = 8 # attempts before a message is moved to the failed folder
+MAIL_BACKOFF = 30 # seconds before the first retry, doubled after every failed attempt (up to an hour)
+MAIL_IDLE_TIMEOUT = 60 # seconds an idle SMTP connection is kept open
+DELIVERABILITY_TTL = 24 * 3600 # seconds a deliverable domain is cached
+DELIVERABILITY_RETRY = 600 # seconds an undeliverable domain is cached (may be a DNS outage)
+
+logger = logging.getLogger("mail-queue")
 
 ## Functions
-def generate_captcha():
-    captcha_text = "".join(random.choices(options, k=6)) # options is a string of characters that can be included in the CAPTCHA. It may be as simple or as complex as you wish. 
-    image = ImageCaptcha(width=400, height=100).generate(captcha_text)
-    return captcha_text, image
+class CaptchaPool:
+    """
+    Pool of pre-rendered CAPTCHAs (text and PNG bytes), refilled by a background worker thread,
+    so that handing one out to a session is a dictionary pop and not image rendering. Rendering only 
+    happens on the worker, so sessions opened faster than it renders get none until their next rerun, instead of using more CPU.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.renderer = ImageCaptcha(width=400, height=100)
+        self.pool = {}
+        self.refill = threading.Event()
+        self.refill.set()
+        threading.Thread(target=self.run, name="captcha-pool", daemon=True).start()
+
+    def render(self):
+        captcha_text = "".join(random.choices(options, k=6)) # options is a string of characters that can be included in the CAPTCHA. It may be as simple or as complex as you wish. 
+        image = self.renderer.generate(captcha_text).getvalue()
+        return captcha_text, image
+
+    def take(self):
+        """
+        Hands out a CAPTCHA without waiting (None when the pool is drained, the worker is refilling it).
+        """
+        self.refill.set()
+        try:
+            return self.pool.popitem()[1]
+        except KeyError:
+            return None
+
+    def run(self):
+        while True:
+            self.refill.wait()
+            self.refill.clear()
+            while len(self.pool) < self.size:
+                captcha = self.render()
+                self.pool[uuid.uuid4().hex] = captcha
+
+@st.cache_resource(show_spinner=False) # used before set_page_config
+def get_captcha_pool():
+    return CaptchaPool(CAPTCHA_POOL_SIZE)
 
-## Generate CAPTCHA
-if 'captcha_text' not in st.session_state:
+def generate_captcha():
+    return get_captcha_pool().take()
+
+def refresh_allowed():
+    """
+    Rate limits CAPTCHA refreshes per session (CAPTCHA_REFRESH_LIMIT within CAPTCHA_REFRESH_WINDOW seconds).
+    """
+    now = time.time()
+    refreshes = [moment for moment in st.session_state.get('captcha_refreshes', []) if now - moment < CAPTCHA_REFRESH_WINDOW]
+    allowed = len(refreshes) < CAPTCHA_REFRESH_LIMIT
+    if allowed:
+        refreshes.append(now)
+    st.session_state.captcha_refreshes = refreshes
+    return allowed
+
+class MailQueue:
+    """
+    Persistent mail queue (one JSON file per message in :directory:) delivered by a background worker thread.
+    The worker keeps one authenticated SMTP connection open while there is mail to send, and retries failed
+    messages with exponential backoff. Messages left in the queue are sent when the app starts again (the worker is 
+    started when the contact page is first loaded). Message files are only ever replaced whole, never rewritten in place.
+    """
+
+    def __init__(self, directory, host, port, username, password, tls=True):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, 'failed')
+        os.makedirs(self.failed_directory, exist_ok=True)
+        self.host, self.port, self.username, self.password, self.tls = host, int(port), username, password, tls
+        self.connection = None
+        self.last_used = 0
+        self.wake = threading.Event()
+        threading.Thread(target=self.run, name="mail-queue", daemon=True).start()
+
+    def put(self, to, subject, body):
+        """
+        Queues a message (written to disk before returning) and wakes the worker.
+        """
+        message = {'to': to, 'subject': subject, 'body': body, 'attempts': 0, 'next_attempt': 0}
+        self.write(f"{time.time_ns()}-{uuid.uuid4().hex}.json", message) # names sort in arrival order
+        self.wake.set()
+
+    def write(self, name, message):
+        """
+        Writes the message file :name: through a temporary file, so that a message is either complete or not (re)written.
+        """
+        temp_path = os.path.join(self.directory, name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(message, file)
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+    def connect(self):
+        """
+        Returns the open SMTP connection if it still answers, otherwise opens (and authenticates) a new one.
+        """
+        if self.connection is not None:
+            try:
+                if self.connection.noop()[0] == 250:
+                    return self.connection
+            except smtplib.SMTPException:
+                pass
+            self.disconnect()
+        connection = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.tls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        self.connection = connection
+        return connection
+
+    def disconnect(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.connection = None
+
+    def send(self, message):
+        msg = MIMEMultipart()
+        msg['From'] = self.username
+        msg['To'] = message['to']
+        msg['Subject'] = message['subject']
+        msg.attach(MIMEText(message['body'], 'plain'))
+        self.connect().sendmail(self.username, message['to'], msg.as_string())
+        self.last_used = time.time()
+
+    def deliver(self, name):
+        """
+        Sends the queued message :name: if it is due, and schedules a retry if sending fails.
+
+        return:
+        :next_attempt: time of the next attempt, or None if the message was sent or moved to the failed folder.
+        """
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, encoding='utf-8') as file:
+                message = json.load(file)
+        except ValueError: # unreadable message, kept aside
+            os.replace(path, os.path.join(self.failed_directory, name))
+            return None
+        if message['next_attempt'] > time.time():
+            return message['next_attempt']
+        try:
+            self.send(message)
+            os.remove(path)
+            return None
+        except (smtplib.SMTPException, OSError):
+            self.disconnect()
+            message['attempts'] += 1
+            message['next_attempt'] = time.time() + min(MAIL_BACKOFF * 2 ** (message['attempts'] - 1), 3600)
+            self.write(name, message)
+            if message['attempts'] >= MAIL_RETRIES:
+                os.replace(path, os.path.join(self.failed_directory, name))
+                return None
+            return message['next_attempt']
+
+    def run(self):
+        # Nothing may end this loop: an error with one message moves it to the failed folder, an error listing the queue is retried later
+        while True:
+            next_due = None
+            try:
+                names = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+            except Exception:
+                logger.exception("Cannot list the mail queue %s", self.directory)
+                names = []
+            for name in names:
+                try:
+                    next_attempt = self.deliver(name)
+                except Exception: # e.g. a queued message without its fields
+                    logger.exception("Queued message %s could not be processed, moved to %s", name, self.failed_directory)
+                    try:
+                        os.replace(os.path.join(self.directory, name), os.path.join(self.failed_directory, name))
+                    except OSError:
+                        pass
+                    continue
+                if next_attempt is not None:
+                    next_due = min(next_due or next_attempt, next_attempt)
+
+            if self.connection is not None and time.time() - self.last_used > MAIL_IDLE_TIMEOUT:
+                self.disconnect()
+
+            # Sleep until the next retry is due, new mail arrives, or the idle connection has to be closed
+            timeout = MAIL_IDLE_TIMEOUT if next_due is None else max(next_due - time.time(), 0)
+            self.wake.wait(timeout)
+            self.wake.clear()
+
+@st.cache_resource(show_spinner=False) # used before set_page_config
+def get_mail_queue():
+    return MailQueue(MAIL_QUEUE, server, port, u, secret, smtp_tls)
+
+@st.cache_resource
+def get_deliverability_cache():
+    return {}
+
+def check_email(email):
+    """
+    Validates an email address. The syntax is checked every time, the deliverability (DNS lookup) once per domain, 
+    for DELIVERABILITY_TTL seconds (DELIVERABILITY_RETRY if it failed).
+
+    input:
+    :email: email address.
+
+    return:
+    :email: normalized email address.
+    """
+    valid = validate_email(email, check_deliverability=False)
+    cache = get_deliverability_cache()
+    checked_at, error = cache.get(valid.ascii_domain, (0, None))
+    if time.time() - checked_at > (DELIVERABILITY_TTL if error is None else DELIVERABILITY_RETRY):
+        try:
+            validate_email(email, check_deliverability=True)
+            error = None
+        except EmailNotValidError as e:
+            error = str(e)
+        cache[valid.ascii_domain] = (time.time(), error)
+    if error is not None:
+        raise EmailNotValidError(error)
+    return valid.normalized
+
+## Start the mail worker, messages queued before a restart are sent without waiting for a new submission
+get_mail_queue()
+
+## Generate CAPTCHA (None when the pool is drained, taken again on the next rerun: any interaction with the page)
+if st.session_state.get('captcha_text') is None:
     st.session_state.captcha_text = generate_captcha()
 
-captcha_text, captcha_image = st.session_state.captcha_text
+captcha_text, captcha_image = st.session_state.captcha_text or (None, None)
 
 ## Contact Form
 
@@ -102,12 +343,20 @@ captcha_input = None # initiate CAPTCHA
 with col3: # right side of the layout
     st.markdown('<p style="text-align: justify; font-size: 12px;">CAPTCHAs are active to prevent automated submissions. <br> Thank you for your understanding.</p>', unsafe_allow_html=True) # warning for user.
     captcha_placeholder = st.empty()
-    captcha_placeholder.image(captcha_image, use_column_width=True)
+    if captcha_image is not None:
+        captcha_placeholder.image(captcha_image, use_column_width=True)
+    else:
+        captcha_placeholder.info(CAPTCHA_PREPARING)
 
     if st.button("Refresh", type="secondary", use_container_width=True): # option to refresh CAPTCHA without refreshing the page
-        st.session_state.captcha_text = generate_captcha()
-        captcha_text, captcha_image = st.session_state.captcha_text
-        captcha_placeholder.image(captcha_image, use_column_width=True)
+        if refresh_allowed():
+            captcha = generate_captcha()
+            if captcha is not None:
+                st.session_state.captcha_text = captcha
+                captcha_text, captcha_image = captcha
+                captcha_placeholder.image(captcha_image, use_column_width=True)
+        else:
+            st.warning("Too many refreshes, please wait a minute.")
 
     captcha_input = st.text_input("Enter the CAPTCHA") # box to insert CAPTCHA
 
@@ -123,52 +372,29 @@ with col1: # left side of the layout
             st.error("Please fill out all required fields.") # error for any blank field
         else:
             try:
-                # Robust email validation
-                valid = validate_email(email, check_deliverability=True)
+                # Robust email validation (deliverability is checked once per domain)
+                valid = check_email(email)
 
                 # Check CAPTCHA
-                if captcha_input.upper() == captcha_text:
+                if captcha_text is None:
+                    st.warning(CAPTCHA_PREPARING)
+                elif captcha_input.upper() == captcha_text:
 
                     # Email configuration - **IMPORTANT**: for security these details should be present in the "Secrets" section of Streamlit
-                    #### NOTE FOR DEVELOPERS: UNCOMMENT THE LINES BELOW ####
-                    
-                    smtp_server = server
-                    smtp_port = port
-                    smtp_username = u
-                    smtp_password = secret
-                    recipient_email = recipient
-
-                    ## Create an SMTP connection
-                    server = smtplib.SMTP(smtp_server, smtp_port)
-                    server.starttls()
-                    server.login(smtp_username, smtp_password)
+                    # Messages are queued and delivered in the background, a slow or unavailable mail server does not block the page
+                    mail_queue = get_mail_queue()
 
                     ## Compose the email message
                     subject = "ASTRAview Contact" # subject of the email you will receive upon contact.
                     body = f"Email: {email}\nMessage: {message}"
-                    msg = MIMEMultipart()
-                    msg['From'] = smtp_username
-                    msg['To'] = recipient_email
-                    msg['Subject'] = subject
-                    msg.attach(MIMEText(body, 'plain'))
-
-                    ## Send the email
-                    server.sendmail(smtp_username, recipient_email, msg.as_string())
+                    mail_queue.put(recipient, subject, body)
 
                     ## Send the confirmation email to the message sender # If you do not want to send a confirmation email leave this section commented
                     current_datetime = datetime.datetime.now()
                     formatted_datetime = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
                     confirmation_subject = f"Confirmation of Contact Form Submission ({formatted_datetime})"
                     confirmation_body = f"Thank you for contacting us! Your message has been received.\n\nYour message:\n {message}"
-                    confirmation_msg = MIMEMultipart()
-                    confirmation_msg['From'] = smtp_username
-                    confirmation_msg['To'] = email  # Use the sender's email address here
-                    confirmation_msg['Subject'] = confirmation_subject
-                    confirmation_msg.attach(MIMEText(confirmation_body, 'plain'))
-                    server.sendmail(smtp_username, email, confirmation_msg.as_string())
-
-                    ## Close the SMTP server connection
-                    server.quit()
+                    mail_queue.put(valid, confirmation_subject, confirmation_body)
 
                     st.success("Sent successfully!") # Success message to the user.
                     
@@ -178,9 +404,10 @@ with col1: # left side of the layout
 
                     # Generate a new captcha to prevent button spamming.
                     st.session_state.captcha_text = generate_captcha()
-                    captcha_text, captcha_image = st.session_state.captcha_text
+                    captcha_text, captcha_image = st.session_state.captcha_text or (None, None)
                     # Update the displayed captcha image
-                    captcha_placeholder.image(captcha_image, use_column_width=True)
+                    if captcha_image is not None:
+                        captcha_placeholder.image(captcha_image, use_column_width=True)
 
                     time.sleep(3)
                     streamlit_js_eval(js_expressions="parent.window.location.reload()")
@@ -70,6 +70,7 @@ st.markdown("""<div style="text-align: justify;">
 
 1. Click the "**Add GEDCOM**" section in the sidebar menu.\n 
 2. **Upload a GEDCOM** file (or one of the provided examples).\n
+    - Compressed files (.ged.gz, .ged.bz2, .zip or GEDZIP .gdz) can be uploaded as they are. \n
     - If the file was parsed correctly a success message will appear. \n
 3. Select a type of **view** (the classic **2D** or the new **3D** visualization) from the drop down menu.\n
 4. Customize the network at your own will: